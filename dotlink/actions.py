@@ -3,18 +3,50 @@
 
 from __future__ import annotations
 
+import copy
+import hashlib
 import logging
+import os
+import shlex
 import shutil
-import tarfile
+import stat
+import time
 from dataclasses import dataclass
 from io import BytesIO
 from pathlib import Path
-from typing import Any, Generator
-
-from .types import Target
-from .util import run
+from typing import Any, Generator, Mapping, Sequence, TYPE_CHECKING
+
+from .agent import Agent, AgentError
+from .generations import (
+    collect,
+    current_generation,
+    entry_link,
+    generation_dir,
+    generations,
+    GENERATIONS_DIR,
+    GENERATIONS_KEEP,
+    link_entries,
+    link_or_copy,
+    link_or_write,
+    read_manifest,
+    switch,
+    write_manifest,
+)
+from .hashes import hash_cache
+from .templates import render_bytes, render_cached
+from .trees import Tree
+from .types import InvalidPlan, Target
+from .util import clone_file, file_hash, format_size, run_async, shell_path
+
+if TYPE_CHECKING:
+    import subprocess
+    from tarfile import TarInfo
 
 LOG = logging.getLogger(__name__)
+SSH_TIMEOUT = 600.0
+UPLOAD_ATTEMPTS = 3
+UPLOAD_CHUNK_SIZE = 4 * 1024 * 1024
+UPLOAD_STAGING = ".cache/dotlink/upload"
 
 
 @dataclass
@@ -25,16 +57,68 @@ class Plan:
         lines = ["Plan:"] + [str(action) for action in self.actions]
         return "\n  ".join(lines)
 
-    def execute(self) -> Generator[Action, None, None]:
+    def prepare(self) -> None:
         for action in self.actions:
             action.prepare()
 
+    def execute(self, prepare: bool = True) -> Generator[Action, None, None]:
+        """
+        Execute each action, yielding them after they complete.
+
+        Actions that fail are logged before their exception is raised.
+        """
+        if prepare:
+            self.prepare()
+
         for action in self.actions:
+            start = time.perf_counter()
+            try:
+                action.execute()
+            except Exception:
+                LOG.error("failed: %s", action)
+                raise
+            action.elapsed = time.perf_counter() - start
             yield action
-            action.execute()
+
+    def checked_actions(self) -> list[Action]:
+        """
+        Actions compared by :meth:`check`: only the remote ones for remote plans.
+        """
+        if any(action.remote for action in self.actions):
+            return [action for action in self.actions if action.remote]
+        return self.actions
+
+    def check(
+        self, content: bool = False, jobs: int | None = None
+    ) -> Generator[tuple[Action, str], None, None]:
+        """
+        Compare each action with its destination, without changing anything.
+
+        Yields actions whose destination has drifted, and the reason why.
+        Remote plans stage their files locally first, and then compare the
+        staged files with the remote host.
+        """
+        from concurrent.futures import ThreadPoolExecutor
+
+        actions = self.checked_actions()
+        if actions is not self.actions:
+            for action in self.actions:
+                if not action.remote:
+                    action.prepare()
+                    action.execute()
+
+        with ThreadPoolExecutor(max_workers=jobs) as pool:
+            results = pool.map(lambda action: action.check(content), actions)
+            for action, drift in zip(actions, results):
+                if drift:
+                    yield action, drift
 
 
 class Action:
+    remote = False
+    size: int | None = None  # bytes written or sent by execute()
+    elapsed: float | None = None
+
     def __init__(self, *args: Any, **kwargs: Any) -> None:
         self.args = args
         self.kwargs = kwargs
@@ -45,12 +129,24 @@ class Action:
     def print(self) -> str:
         return f"{self.args!r}, {self.kwargs!r}"
 
+    def report(self) -> str:
+        """
+        Bytes written and throughput, once executed.
+        """
+        if self.size is None or self.elapsed is None:
+            return ""
+        rate = self.size / max(self.elapsed, 1e-6)
+        return f"{format_size(self.size)} in {self.elapsed:.2f}s, {format_size(rate)}/s"
+
     def prepare(self) -> None:
         pass
 
     def execute(self) -> None:
         raise NotImplementedError
 
+    def check(self, content: bool = False) -> str | None:
+        raise NotImplementedError
+
 
 class Copy(Action):
     def __init__(self, src: Path, dest: Path) -> None:
@@ -74,12 +170,68 @@ class Copy(Action):
 
     def execute(self) -> None:
         if self.src.is_dir():
+            self.size = 0
+
+            def copy(src: str, dest: str) -> None:
+                assert self.size is not None
+                self.size += clone_file(Path(src), Path(dest))
+                shutil.copystat(src, dest)
+
             if self.dest.is_symlink():
                 self.dest.unlink(missing_ok=True)
-            shutil.copytree(self.src, self.dest, dirs_exist_ok=True)
+            shutil.copytree(self.src, self.dest, copy_function=copy, dirs_exist_ok=True)
         else:
             self.dest.unlink(missing_ok=True)
-            shutil.copyfile(self.src, self.dest)
+            self.size = clone_file(self.src, self.dest)
+
+    def check(self, content: bool = False) -> str | None:
+        if not self.src.exists():
+            return "source missing"
+        if self.dest.is_symlink():
+            return "symlink"
+        if not self.dest.exists():
+            return "missing"
+
+        if self.src.is_dir():
+            if not self.dest.is_dir():
+                return "not a directory"
+            srcs = [
+                Path(dirpath) / filename
+                for dirpath, _, filenames in os.walk(self.src)
+                for filename in sorted(filenames)
+            ]
+            if content:
+                hash_cache().hash_many(srcs)  # hash sources in parallel, up front
+            for src in srcs:
+                rel = src.relative_to(self.src)
+                if drift := compare_files(src, self.dest / rel, content):
+                    return f"{rel}: {drift}"
+            return None
+
+        if self.dest.is_dir():
+            return "not a file"
+        return compare_files(self.src, self.dest, content)
+
+    def stage(self, dest: Path, previous: Path | None) -> int:
+        """
+        Copy the source to another destination, hardlinking unchanged files from
+        a previous copy. Returns the number of bytes copied.
+        """
+        if not self.src.is_dir():
+            return link_or_copy(self.src, dest, previous)
+
+        size = 0
+        dest.mkdir(parents=True, exist_ok=True)
+        # follow symlinks and keep empty directories, like copytree() does
+        for dirpath, dirnames, filenames in os.walk(self.src, followlinks=True):
+            for dirname in dirnames:
+                rel = (Path(dirpath) / dirname).relative_to(self.src)
+                (dest / rel).mkdir(exist_ok=True)
+            for filename in filenames:
+                rel = (Path(dirpath) / filename).relative_to(self.src)
+                prev = previous / rel if previous else None
+                size += link_or_copy(self.src / rel, dest / rel, prev)
+        return size
 
 
 class Symlink(Copy):
@@ -92,8 +244,344 @@ class Symlink(Copy):
         self.dest.unlink(missing_ok=True)
         self.dest.symlink_to(self.src)
 
+    def check(self, content: bool = False) -> str | None:
+        if not self.dest.is_symlink():
+            return "not a symlink" if self.dest.exists() else "missing"
+        if (link := Path(os.readlink(self.dest))) != self.src:
+            return f"points to {link}"
+        return None
+
+
+class Extract(Copy):
+    """
+    Copy files from a source tree that isn't checked out on the filesystem.
+    """
+
+    def __init__(self, tree: Tree, path: Path, dest: Path) -> None:
+        super().__init__(tree.root / path, dest)
+        self.tree = tree
+        self.path = path
+        # archives can then read every mapped file in a single pass
+        tree.prefetch(path for path, _ in self.files())
+
+    def prepare(self) -> None:
+        if not self.tree.exists(self.path):
+            raise FileNotFoundError(f"{self.src} does not exist")
+
+        if not self.dest.is_symlink() and (
+            (self.dest.is_dir() and self.tree.is_file(self.path))
+            or (self.dest.is_file() and self.tree.is_dir(self.path))
+        ):
+            raise RuntimeError(f"file/dir type mismatch {self.src} != {self.dest}")
+
+        self.dest.parent.mkdir(parents=True, exist_ok=True)
+
+    def files(self) -> list[tuple[Path, Path]]:
+        if self.tree.is_dir(self.path):
+            return [(self.path / f, self.dest / f) for f in self.tree.files(self.path)]
+        return [(self.path, self.dest)]
+
+    def execute(self) -> None:
+        if self.tree.is_dir(self.path) and self.dest.is_symlink():
+            self.dest.unlink()
+
+        self.size = 0
+        for path, dest in self.files():
+            data = self.tree.read_bytes(path)
+            mode = self.tree.mode(path)
+            self.size += len(data)
+            dest.parent.mkdir(parents=True, exist_ok=True)
+            dest.unlink(missing_ok=True)
+            if stat.S_ISLNK(mode):
+                dest.symlink_to(data.decode("utf-8"))
+            else:
+                dest.write_bytes(data)
+                if mode & stat.S_IXUSR:
+                    dest.chmod(dest.stat().st_mode | 0o111)
+
+    def check(self, content: bool = False) -> str | None:
+        if not self.tree.exists(self.path):
+            return "source missing"
+        if self.tree.is_dir(self.path):
+            if self.dest.is_symlink():
+                return "symlink"
+            if not self.dest.exists():
+                return "missing"
+            if not self.dest.is_dir():
+                return "not a directory"
+
+        # trees have no useful mtimes, so always compare content
+        for path, dest in self.files():
+            rel = path.relative_to(self.path)
+            prefix = f"{rel}: " if rel != Path() else ""
+            data = self.tree.read_bytes(path)
+            if stat.S_ISLNK(self.tree.mode(path)):
+                if not dest.is_symlink():
+                    return (
+                        f"{prefix}not a symlink"
+                        if dest.exists()
+                        else f"{prefix}missing"
+                    )
+                if (link := os.readlink(dest)) != data.decode("utf-8"):
+                    return f"{prefix}points to {link}"
+                continue
+            if dest.is_symlink():
+                return f"{prefix}symlink"
+            if not dest.exists():
+                return f"{prefix}missing"
+            if not dest.is_file():
+                return f"{prefix}not a file"
+            if dest.stat().st_size != len(data):
+                return f"{prefix}size"
+            if dest.read_bytes() != data:
+                return f"{prefix}content"
+        return None
+
+    def stage(self, dest: Path, previous: Path | None) -> int:
+        size = 0
+        for path, file_dest in self.files():
+            rel = file_dest.relative_to(self.dest)
+            out = dest / rel
+            data = self.tree.read_bytes(path)
+            mode = self.tree.mode(path)
+            if stat.S_ISLNK(mode):
+                out.parent.mkdir(parents=True, exist_ok=True)
+                out.symlink_to(data.decode("utf-8"))
+            else:
+                perms = 0o755 if mode & stat.S_IXUSR else 0o644
+                prev = previous / rel if previous else None
+                size += link_or_write(data, perms, out, prev)
+        return size
+
+
+class Template(Copy):
+    """
+    Render a template with per-target variables, and copy the result.
+
+    Renders are cached by the hash of the template and its variables, so
+    unchanged templates are only hashed, and renders are shared between targets.
+    """
+
+    def __init__(
+        self,
+        src: Path,
+        dest: Path,
+        variables: Mapping[str, str],
+        tree: Tree | None = None,
+    ) -> None:
+        super().__init__(src, dest)
+        self.variables = variables
+        self.tree = tree
+        self.rendered: Path | None = None
+
+    def read(self) -> bytes:
+        if self.tree is not None:
+            return self.tree.read_bytes(self.src.relative_to(self.tree.root))
+        return self.src.read_bytes()
+
+    def prepare(self) -> None:
+        exists = (
+            self.tree.is_file(self.src.relative_to(self.tree.root))
+            if self.tree is not None
+            else self.src.is_file()
+        )
+        if not exists:
+            raise FileNotFoundError(f"template {self.src} does not exist")
+
+        if not self.dest.is_symlink() and self.dest.is_dir():
+            raise RuntimeError(f"file/dir type mismatch {self.src} != {self.dest}")
+
+        # render early, so that template errors surface before anything changes
+        try:
+            self.rendered = render_cached(self.read(), self.variables)
+        except InvalidPlan as e:
+            raise InvalidPlan(f"{self.src}: {e}") from None
+        self.dest.parent.mkdir(parents=True, exist_ok=True)
+
+    def execute(self) -> None:
+        assert self.rendered is not None, "prepare() must be called first"
+        self.dest.unlink(missing_ok=True)
+        self.size = clone_file(self.rendered, self.dest)
+
+    def check(self, content: bool = False) -> str | None:
+        try:
+            rendered = render_bytes(self.read(), self.variables)
+        except FileNotFoundError:
+            return "source missing"
+        except InvalidPlan as e:
+            raise InvalidPlan(f"{self.src}: {e}") from None
+        if self.dest.is_symlink():
+            return "symlink"
+        if not self.dest.exists():
+            return "missing"
+        if self.dest.is_dir():
+            return "not a file"
+        # renders always have a new mtime, so always compare content
+        if self.dest.stat().st_size != len(rendered):
+            return "size"
+        if self.dest.read_bytes() != rendered:
+            return "content"
+        return None
+
+    def stage(self, dest: Path, previous: Path | None) -> int:
+        assert self.rendered is not None, "prepare() must be called first"
+        # deploy with default permissions, rather than those of the cached render
+        return link_or_write(self.rendered.read_bytes(), 0o644, dest, previous)
+
+
+class Generation(Action):
+    """
+    Copy every entry into a new generation, then switch to it all at once.
+
+    Mapped entries are symlinks through ``.dotlink/current``, which is replaced
+    atomically once the new generation is complete. Unchanged files are
+    hardlinked from the previous generation rather than copied again.
+    """
+
+    def __init__(
+        self, root: Path, actions: Sequence[Copy], keep: int = GENERATIONS_KEEP
+    ) -> None:
+        self.root = root
+        self.actions = actions
+        self.keep = keep
+        self.number: int | None = None
+
+    def print(self) -> str:
+        lines = [f"{len(self.actions)} entries in {self.root}"] + [
+            f"  {action.print()}" for action in self.actions
+        ]
+        return "\n  ".join(lines)
+
+    def entries(self) -> list[Path]:
+        return [action.dest.relative_to(self.root) for action in self.actions]
+
+    def prepare(self) -> None:
+        for action in self.actions:
+            if not action.dest.is_symlink() and action.dest.is_dir():
+                raise RuntimeError(f"atomic destination {action.dest} is a directory")
+            action.prepare()
+
+    def execute(self) -> None:
+        staging = self.root / GENERATIONS_DIR / "new"
+        if staging.exists():
+            shutil.rmtree(staging)  # left behind by an interrupted deploy
+        staging.mkdir(parents=True)
+
+        current = current_generation(self.root)
+        previous = generation_dir(self.root, current) if current is not None else None
+        entries = self.entries()
+        self.size = 0
+        for action, rel in zip(self.actions, entries):
+            prev = previous / rel if previous else None
+            self.size += action.stage(staging / rel, prev)
+
+        self.number = max(generations(self.root), default=0) + 1
+        staging.rename(generation_dir(self.root, self.number))
+        write_manifest(self.root, self.number, entries)
+        switch(self.root, self.number)
+
+        old = read_manifest(self.root, current) if current is not None else []
+        link_entries(self.root, entries, old)
+        collect(self.root, self.keep)
+
+    def check(self, content: bool = False) -> str | None:
+        current = current_generation(self.root)
+        if current is None:
+            return "no current generation"
+
+        for action, rel in zip(self.actions, self.entries()):
+            link = self.root / rel
+            if not link.is_symlink():
+                return f"{rel}: not a symlink" if link.exists() else f"{rel}: missing"
+            if (target := os.readlink(link)) != entry_link(self.root, rel):
+                return f"{rel}: points to {target}"
+
+            staged = copy.copy(action)
+            staged.dest = generation_dir(self.root, current) / rel
+            if drift := staged.check(content):
+                return f"{rel}: {drift}"
+        return None
+
+
+def compare_files(src: Path, dest: Path, content: bool = False) -> str | None:
+    """
+    Compare a copied file with its source by size and mtime, or content hash.
+
+    Source hashes come from the persistent hash cache, so unchanged sources are
+    only read once across runs.
+    """
+    try:
+        dest_stat = dest.stat()
+    except FileNotFoundError:
+        return "missing"
+    src_stat = src.stat()
+
+    if src_stat.st_size != dest_stat.st_size:
+        return "size"
+    if content:
+        return "content" if hash_cache().hash(src) != file_hash(dest) else None
+    if src_stat.st_mtime_ns > dest_stat.st_mtime_ns:
+        return "mtime"
+    return None
+
+
+def local_files(root: Path) -> list[Path]:
+    """
+    Relative paths of files and symlinks within a directory, excluding .git.
+    """
+    paths: list[Path] = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = [d for d in dirnames if d != ".git"]
+        # symlinks to directories are listed, but not followed, by os.walk
+        links = [d for d in dirnames if (Path(dirpath) / d).is_symlink()]
+        for name in filenames + links:
+            paths.append((Path(dirpath) / name).relative_to(root))
+    return sorted(paths)
+
+
+def compare_remote(target: Target, root: Path, content: bool = False) -> str | None:
+    """
+    Compare a local directory with the target path on its remote host.
+
+    Every file is compared by size, or content hash, in a single round trip.
+    Remote mtimes are set at extraction, so they are not compared.
+    """
+    paths = local_files(root)
+    ops: list[dict[str, Any]] = []
+    for path in paths:
+        dest = target.path / path
+        ops.append(Agent.stat(dest))
+        if content and not (root / path).is_symlink():
+            ops.append(Agent.hash(dest))
+
+    with Agent.ssh(target) as agent:
+        results = iter(agent.request(ops))
+
+    for path in paths:
+        src = root / path
+        info = next(results)
+        if "error" in info:
+            return f"{path}: {info['error']}"
+        if src.is_symlink():
+            if info["type"] != "symlink":
+                return f"{path}: not a symlink" if info["type"] else f"{path}: missing"
+            if info["target"] != os.readlink(src):
+                return f"{path}: points to {info['target']}"
+            continue
+
+        digest = next(results) if content else {}
+        if info["type"] != "file":
+            return f"{path}: not a file" if info["type"] else f"{path}: missing"
+        if info["size"] != src.stat().st_size:
+            return f"{path}: size"
+        if content and digest.get("hash") != file_hash(src):
+            return f"{path}: content"
+    return None
+
 
 class Deploy(Action):
+    remote = True
+
     def __init__(self, src: Path, target: Target) -> None:
         self.src = src
         self.target = target
@@ -101,6 +589,11 @@ class Deploy(Action):
     def print(self) -> str:
         return f"{self.src} -> {self.target}"
 
+    def check(self, content: bool = False) -> str | None:
+        if not self.src.is_dir():
+            return "source missing"
+        return compare_remote(self.target, self.src, content)
+
 
 class SSHTarball(Deploy):
     def prepare(self) -> None:
@@ -111,22 +604,234 @@ class SSHTarball(Deploy):
             raise ValueError(f"target {self.target} is not remote")
 
     def execute(self) -> None:
+        import tarfile
+
         stream = BytesIO()
         with tarfile.open(mode="w|gz", fileobj=stream) as tf:
             tf.add(self.src, arcname=".")
 
         stream.seek(0)
         self.data = stream.read()
+        self.size = len(self.data)
         LOG.debug("tarball compressed size %d bytes", len(self.data))
 
-        run(
-            "ssh",
-            self.target.address,
-            "tar",
-            "-xz",
-            "-f-",
-            "-C",
-            self.target.path.as_posix(),
-            input=self.data,
-            encoding=None,
+        import asyncio
+
+        asyncio.run(
+            run_async(
+                "ssh",
+                self.target.address,
+                "tar",
+                "-xz",
+                "-f-",
+                "-C",
+                self.target.path.as_posix(),
+                input=self.data,
+                timeout=SSH_TIMEOUT,
+            )
+        )
+
+
+class RSync(Deploy):
+    """
+    Incrementally sync a local directory to a remote path, using delta transfer.
+    """
+
+    def prepare(self) -> None:
+        if not self.src.is_dir():
+            raise RuntimeError(f"{self.src} is not a directory")
+
+        if not self.target.remote:
+            raise ValueError(f"target {self.target} is not remote")
+
+    def execute(self) -> None:
+        import asyncio
+
+        path = self.target.path.as_posix()
+        asyncio.run(
+            run_async(
+                "rsync",
+                "--archive",
+                "--delete",
+                "--exclude=/.git",
+                f"--rsync-path=mkdir -p {shell_path(self.target.path)} && rsync",
+                "-e",
+                "ssh",
+                f"{self.src.as_posix()}/",
+                f"{self.target.address}:{path}/",
+                timeout=SSH_TIMEOUT,
+            )
         )
+
+
+class RemoteSymlinks(Action):
+    """
+    Create symlinks on a remote host through the remote helper, over one session.
+
+    Link sources are relative to the remote user's home directory, and existing
+    links that already point to the right place are left untouched. Every
+    destination is checked before any of them are changed.
+    """
+
+    remote = True
+
+    def __init__(self, target: Target, links: Sequence[tuple[Path, Path]]) -> None:
+        self.target = target
+        self.links = links
+
+    def print(self) -> str:
+        lines = [f"{len(self.links)} links on {self.target}"] + [
+            f"  ~/{src.as_posix()} -> {dest.as_posix()}" for src, dest in self.links
+        ]
+        return "\n  ".join(lines)
+
+    def prepare(self) -> None:
+        if not self.target.remote:
+            raise ValueError(f"target {self.target} is not remote")
+
+    def check(self, content: bool = False) -> str | None:
+        with Agent.ssh(self.target) as agent:
+            results = agent.request(
+                [Agent.stat(dest) for _, dest in self.links]
+                + [Agent.expand(Path("~") / src) for src, _ in self.links]
+            )
+
+        stats, sources = results[: len(self.links)], results[len(self.links) :]
+        for (_, dest), info, source in zip(self.links, stats, sources):
+            if "error" in info:
+                return f"{dest}: {info['error']}"
+            if info["type"] != "symlink":
+                return f"{dest}: not a symlink" if info["type"] else f"{dest}: missing"
+            if info["target"] != source["path"]:
+                return f"{dest}: points to {info['target']}"
+        return None
+
+    def execute(self) -> None:
+        with Agent.ssh(self.target) as agent:
+            # check every destination before changing any of them
+            results = agent.request([Agent.stat(dest) for _, dest in self.links])
+            for (_, dest), info in zip(self.links, results):
+                if "error" in info:
+                    raise AgentError(f"{dest}: {info['error']}")
+                if info["type"] == "dir":
+                    raise RuntimeError(f"symlink destination {dest} is a directory")
+
+            results = agent.request(
+                [Agent.symlink(dest, f"~/{src.as_posix()}") for src, dest in self.links]
+            )
+            for (_, dest), result in zip(self.links, results):
+                if "error" in result:
+                    raise AgentError(f"{dest}: {result['error']}")
+
+
+class SSHChunked(SSHTarball):
+    """
+    Upload the tarball in content-addressed chunks to a remote staging directory.
+
+    Chunks already present on the remote are skipped, so a failed or interrupted
+    upload can be retried without resending everything. The tarball is only
+    extracted into the target path after every chunk has arrived, and the
+    reassembled tarball matches its checksum.
+    """
+
+    def __init__(
+        self, src: Path, target: Target, attempts: int = UPLOAD_ATTEMPTS
+    ) -> None:
+        super().__init__(src, target)
+        self.attempts = attempts
+
+    def tarball(self) -> bytes:
+        import tarfile
+
+        # normalize mtimes so that unchanged sources produce identical chunks
+        def normalize(info: TarInfo) -> TarInfo:
+            info.mtime = 0
+            return info
+
+        stream = BytesIO()
+        with tarfile.open(mode="w|", fileobj=stream) as tf:
+            tf.add(self.src, arcname=".", filter=normalize)
+        return stream.getvalue()
+
+    async def ssh(
+        self, script: str, input: bytes | None = None
+    ) -> subprocess.CompletedProcess[bytes]:
+        return await run_async(
+            "ssh", self.target.address, script, input=input, timeout=SSH_TIMEOUT
+        )
+
+    async def upload(self, chunks: dict[str, bytes]) -> None:
+        import asyncio
+        import gzip
+
+        staging = shlex.quote(UPLOAD_STAGING)
+        proc = await self.ssh(f"mkdir -p {staging} && ls -1 {staging}")
+        existing = set(proc.stdout.decode().split())
+        missing = [digest for digest in chunks if digest not in existing]
+        LOG.debug("uploading %d of %d chunks", len(missing), len(chunks))
+
+        # let every upload finish before failing, so chunks that made it are kept
+        results = await asyncio.gather(
+            *(
+                self.ssh(
+                    f"cat > {staging}/{digest}.part"
+                    f" && mv {staging}/{digest}.part {staging}/{digest}",
+                    input=gzip.compress(chunks[digest], mtime=0),
+                )
+                for digest in missing
+            ),
+            return_exceptions=True,
+        )
+        for result in results:
+            if isinstance(result, BaseException):
+                raise result
+
+    async def extract(self, digests: list[str], key: str) -> None:
+        staging = shlex.quote(UPLOAD_STAGING)
+        names = " ".join(f"{staging}/{digest}" for digest in digests)
+        parts = " ".join(
+            f"{staging}/{digest}.part" for digest in dict.fromkeys(digests)
+        )
+        tarball = f"{staging}/{key}.tar"
+        # verify the reassembled tarball before extracting anything, and discard
+        # the chunks if it doesn't match, so that a retry uploads them again
+        sha256 = f"(sha256sum {tarball} || shasum -a 256 {tarball}) 2>/dev/null"
+        script = "\n".join(
+            [
+                f"gzip -dc {names} > {tarball} && digest=$( {sha256})",
+                f'if [ "${{digest%% *}}" != {key} ]; then',
+                f"  rm -f {tarball} {names}",
+                f"  echo 'dotlink: reassembled tarball does not match {key}' >&2",
+                "  exit 1",
+                "fi",
+                f"tar -x -m -f {tarball} -C {shell_path(self.target.path)}"
+                f" && rm -f {tarball} {names} {parts}",
+            ]
+        )
+        await self.ssh(f"sh -c {shlex.quote(script)}")
+
+    def execute(self) -> None:
+        import asyncio
+        import subprocess
+
+        self.data = self.tarball()
+        self.size = len(self.data)
+        key = hashlib.sha256(self.data).hexdigest()
+        chunks: dict[str, bytes] = {}
+        digests: list[str] = []
+        for offset in range(0, len(self.data), UPLOAD_CHUNK_SIZE):
+            chunk = self.data[offset : offset + UPLOAD_CHUNK_SIZE]
+            digest = hashlib.sha256(chunk).hexdigest()
+            chunks[digest] = chunk
+            digests.append(digest)
+        LOG.debug("tarball size %d bytes, %d chunks", len(self.data), len(chunks))
+
+        for attempt in range(1, self.attempts + 1):
+            try:
+                asyncio.run(self.upload(chunks))
+                asyncio.run(self.extract(digests, key))
+                break
+            except (subprocess.CalledProcessError, subprocess.TimeoutExpired) as e:
+                if attempt >= self.attempts:
+                    raise
+                LOG.warning("upload attempt %d failed, retrying: %s", attempt, e)
@@ -0,0 +1,146 @@
+# Copyright Amethyst Reese
+# Licensed under the MIT license
+
+from __future__ import annotations
+
+import base64
+import json
+import shlex
+import sys
+from pathlib import Path
+from types import TracebackType
+from typing import Any, Mapping, Sequence
+
+from typing_extensions import Self
+
+from .types import Target
+
+HELPER = Path(__file__).parent / "helper.py"
+REMOTE_PYTHON = "python3"
+
+
+class AgentError(RuntimeError): ...
+
+
+def bootstrap(code: bytes) -> str:
+    """
+    Python snippet that reads the helper's source from stdin and runs it.
+    """
+    return f"import sys; exec(sys.stdin.buffer.read({len(code)}))"
+
+
+class Agent:
+    """
+    Client for the remote helper, speaking one JSON line per batch of requests.
+
+    The helper only needs the remote host's standard python, and its source is
+    piped over the same session before any requests, so nothing needs to be
+    installed remotely.
+    """
+
+    def __init__(self, cmd: Sequence[str]) -> None:
+        import subprocess
+
+        self.cmd = cmd
+        self.proc = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+        assert self.proc.stdin and self.proc.stdout
+        self.stdin = self.proc.stdin
+        self.stdout = self.proc.stdout
+        self.send(HELPER.read_bytes())
+
+    @classmethod
+    def ssh(cls, target: Target) -> Self:
+        code = HELPER.read_bytes()
+        command = f"{REMOTE_PYTHON} -c {shlex.quote(bootstrap(code))}"
+        return cls(["ssh", target.address, command])
+
+    @classmethod
+    def local(cls) -> Self:
+        """
+        Run the helper in a local subprocess, in place of a remote host.
+        """
+        return cls([sys.executable, "-c", bootstrap(HELPER.read_bytes())])
+
+    def __enter__(self) -> Self:
+        return self
+
+    def __exit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc: BaseException | None,
+        tb: TracebackType | None,
+    ) -> None:
+        self.close()
+
+    def close(self) -> None:
+        try:
+            self.stdin.close()
+        except BrokenPipeError:
+            pass
+        self.proc.wait()
+        self.stdout.close()
+
+    def send(self, data: bytes) -> None:
+        try:
+            self.stdin.write(data)
+            self.stdin.flush()
+        except BrokenPipeError:
+            pass  # reported when reading the response
+
+    def request(self, ops: Sequence[Mapping[str, Any]]) -> list[dict[str, Any]]:
+        """
+        Send a batch of operations in a single round trip, returning their results.
+
+        Failed operations have an ``error`` key in their result.
+        """
+        if not ops:
+            return []
+        self.send(json.dumps(list(ops), separators=(",", ":")).encode() + b"\n")
+
+        line = self.stdout.readline()
+        if not line:
+            code = self.proc.wait()
+            raise AgentError(f"helper exited with {code} ({shlex.join(self.cmd)})")
+        results: list[dict[str, Any]] = json.loads(line)
+        return results
+
+    @staticmethod
+    def expand(path: Path) -> dict[str, Any]:
+        """
+        Expand a leading ``~`` in the path on the remote host.
+        """
+        return {"op": "expand", "path": path.as_posix()}
+
+    @staticmethod
+    def stat(path: Path) -> dict[str, Any]:
+        return {"op": "stat", "path": path.as_posix()}
+
+    @staticmethod
+    def hash(path: Path) -> dict[str, Any]:
+        return {"op": "hash", "path": path.as_posix()}
+
+    @staticmethod
+    def mkdir(path: Path) -> dict[str, Any]:
+        return {"op": "mkdir", "path": path.as_posix()}
+
+    @staticmethod
+    def symlink(path: Path, target: str) -> dict[str, Any]:
+        """
+        Replace the path with a symlink, unless it already points to the target.
+
+        A leading ``~`` in the target is expanded on the remote host.
+        """
+        return {"op": "symlink", "path": path.as_posix(), "target": target}
+
+    @staticmethod
+    def write(path: Path, data: bytes, mode: int | None = None) -> dict[str, Any]:
+        return {
+            "op": "write",
+            "path": path.as_posix(),
+            "data": base64.b64encode(data).decode("ascii"),
+            "mode": mode,
+        }
+
+    @staticmethod
+    def delete(path: Path, recursive: bool = False) -> dict[str, Any]:
+        return {"op": "delete", "path": path.as_posix(), "recursive": recursive}
@@ -11,12 +11,19 @@ from pathlib import Path
 import click
 
 from .__version__ import __version__
-from .core import dotlink
-from .types import Method, Source, Target
+from .types import InvalidPlan, Method, Source, Target
 
 LOG = logging.getLogger(__name__)
 
 
+def annotate(text: str, note: str) -> str:
+    """
+    Add a note to the first line of a possibly multi-line description.
+    """
+    first, newline, rest = text.partition("\n")
+    return f"{first} ({note}){newline}{rest}"
+
+
 @click.command("dotlink")
 @click.version_option(__version__, "--version", "-V")
 @click.option("--debug", "-D", is_flag=True, help="enable debug output")
@@ -26,21 +33,64 @@ LOG = logging.getLogger(__name__)
     is_flag=True,
     help="print planned actions without executing",
 )
+@click.option(
+    "--diff",
+    is_flag=True,
+    help="print diffs of files that would change, without executing",
+)
+@click.option(
+    "--check",
+    is_flag=True,
+    help="compare destinations with planned actions, exit non-zero on drift",
+)
+@click.option(
+    "--hash",
+    "content",
+    is_flag=True,
+    help="compare content hashes of copies when checking",
+)
+@click.option(
+    "--resumable",
+    is_flag=True,
+    help="upload to remote targets in chunks that can resume after failures",
+)
+@click.option(
+    "--remote-symlink",
+    is_flag=True,
+    help="sync sources to a cache on remote targets and symlink to them",
+)
+@click.option(
+    "--atomic",
+    is_flag=True,
+    help="copy into a new generation, and switch to it all at once",
+)
+@click.option(
+    "--rollback",
+    is_flag=True,
+    help="switch back to the previous generation of an atomic deploy",
+)
 @click.option(
     "--symlink / --copy",
     default=True,
     help="use symlinks or copies (default symlink)",
 )
-@click.argument("source", required=False, default=".")
-@click.argument("target", required=False, default=Path.home().as_posix())
+@click.argument("source", required=False)
+@click.argument("targets", nargs=-1)
 @click.pass_context
 def main(
     ctx: click.Context,
     debug: bool,
     dry_run: bool,
+    diff: bool,
+    check: bool,
+    content: bool,
+    resumable: bool,
+    remote_symlink: bool,
+    atomic: bool,
+    rollback: bool,
     symlink: bool,
-    source: str,
-    target: str,
+    source: str | None,
+    targets: tuple[str, ...],
 ) -> None:
     """
     Copy or symlink dotfiles from a profile repository to a new location,
@@ -50,7 +100,10 @@ def main(
     Defaults to current working directory.
 
     Target must be a local path or remote SSH/SCP destination [[user@]host:path].
-    Defaults to the user's home directory.
+    Defaults to the user's home directory. Multiple targets may be given, and
+    will be deployed concurrently from a single copy of the source.
+
+    With --rollback, no source is needed, and every argument is a target.
 
     See https://github.com/amyreese/dotlink for more information.
     """
@@ -59,18 +112,73 @@ def main(
         stream=sys.stderr,
     )
 
-    if symlink and platform.system() == "Windows":
-        ctx.fail("symlinks not supported on Windows, use --copy")
+    if platform.system() == "Windows":
+        if atomic or rollback:
+            ctx.fail("atomic deploys need symlinks, which aren't supported on Windows")
+        if symlink:
+            ctx.fail("symlinks not supported on Windows, use --copy")
 
-    plan = dotlink(
-        source=Source.parse(source),
-        target=Target.parse(target),
-        method=Method.symlink if symlink else Method.copy,
-    )
+    # imported here so that --help and --version don't pay for it
+    from .core import dotlink_targets, execute_plans
+
+    if rollback and source is not None:
+        targets = (source, *targets)  # rollbacks don't need a source
+    dests = [Target.parse(target) for target in targets or [Path.home().as_posix()]]
+    if diff and any(dest.remote for dest in dests):
+        ctx.fail("--diff not supported for remote targets")
+    if (atomic or rollback) and any(dest.remote for dest in dests):
+        ctx.fail("atomic deploys not supported for remote targets")
+
+    if rollback:
+        from .generations import rollback as rollback_generation
+
+        for dest in dests:
+            try:
+                number = rollback_generation(dest.path.resolve())
+            except InvalidPlan as e:
+                ctx.fail(str(e))
+            print(f"rolled back {dest} to generation {number}")
+        return
+
+    try:
+        plans = dotlink_targets(
+            source=Source.parse(source or "."),
+            targets=dests,
+            method=Method.symlink if symlink else Method.copy,
+            resumable=resumable,
+            remote_symlink=remote_symlink,
+            atomic=atomic,
+        )
+
+        if check:
+            drifted = 0
+            total = 0
+            for plan in plans:
+                total += len(plan.checked_actions())
+                for action, drift in plan.check(content=content):
+                    drifted += 1
+                    print(f"drift: {annotate(action.print(), drift)}")
+            if drifted:
+                print(f"{drifted} of {total} checked actions drifted")
+                ctx.exit(1)
+            print("no drift")
+        elif diff:
+            from .diffs import plan_diffs
 
-    if dry_run:
-        print(plan)
-    else:
-        for action in plan.execute():
-            print(action)
-        print("done")
+            changed = 0
+            for text in plan_diffs(plans, content=content):
+                changed += 1
+                print(text, end="", flush=True)
+            print(f"{changed} files changed" if changed else "no changes")
+        elif dry_run:
+            for plan in plans:
+                print(plan)
+        else:
+            for action in execute_plans(plans):
+                if report := action.report():
+                    print(annotate(str(action), report))
+                else:
+                    print(action)
+            print("done")
+    except InvalidPlan as e:
+        ctx.fail(str(e))
@@ -5,39 +5,83 @@ from __future__ import annotations
 
 import atexit
 import logging
+import threading
 from pathlib import Path
-from pprint import pformat
-from tempfile import TemporaryDirectory
-from typing import Generator
-
-from platformdirs import user_cache_dir
-
-from .actions import Action, Copy, Plan, SSHTarball, Symlink
+from queue import Queue
+from typing import Generator, Sequence
+
+from .actions import (
+    Action,
+    Copy,
+    Extract,
+    Generation,
+    Plan,
+    RemoteSymlinks,
+    RSync,
+    SSHChunked,
+    SSHTarball,
+    Symlink,
+    Template,
+)
+from .index import DestinationIndex
+from .patterns import Entry, expand, is_pattern, tree_entries, walk_cache
+from .templates import is_template, template_variables
+from .trees import GitTree, is_archive, open_archive, Tree
 from .types import Config, InvalidPlan, Method, Pair, Source, Target
-from .util import run, sha1
+from .util import run_async, sha1, user_cache_dir
 
 LOG = logging.getLogger(__name__)
 SUPPORTED_MAPPING_NAMES = (".dotlink", "dotlink")
 COMMENT = "#"
 INCLUDE = "@"
 SEPARATOR = "="
+GIT_TIMEOUT = 300.0
+REMOTE_CACHE = Path(".cache/dotlink/sources")
 
 
-def discover_config(root: Path) -> Path:
+def discover_config(root: Path, tree: Tree | None = None) -> Path:
     for filename in SUPPORTED_MAPPING_NAMES:
-        if (path := root / filename).is_file():
+        path = root / filename
+        if tree.is_file(Path(filename)) if tree else path.is_file():
             LOG.debug("discover config file %s", path)
             return path
     raise FileNotFoundError(f"no dotlink mapping found in {root}")
 
 
-def generate_config(root: Path) -> Config:
-    root = root.resolve()
-    path = discover_config(root)
-    content = path.read_text()
+def generate_config(
+    root: Path, tree: Tree | None = None, checkout: bool = True
+) -> Config:
+    """
+    Parse the mapping file from a source root, along with any includes.
+
+    Sources backed by a :class:`Tree` are read from the tree rather than the
+    filesystem. Without ``checkout``, git includes are read as trees too.
+    """
+    if tree is None:
+        root = root.resolve()
+        content = discover_config(root).read_text()
+    else:
+        root = tree.root
+        content = tree.read_text(discover_config(root, tree).relative_to(root))
 
     paths: dict[Path, Path] = {}
-    includes: list[Config] = []
+    subsources: dict[str, Source] = {}
+    listing: list[Entry] = []
+
+    def entries() -> list[Entry]:
+        # walk the source root at most once, and only if a pattern needs it
+        if not listing:
+            if tree is None:
+                cache = walk_cache()
+                listing.extend(cache.walk(root, ignore=SUPPORTED_MAPPING_NAMES))
+                cache.save()
+            else:
+                listing.extend(
+                    entry
+                    for entry in tree_entries(tree.files(Path()))
+                    if entry[0] not in SUPPORTED_MAPPING_NAMES
+                )
+        return listing
 
     for line in content.splitlines():
         if line.lstrip().startswith(COMMENT):
@@ -52,27 +96,49 @@ def generate_config(root: Path) -> Config:
                     raise InvalidPlan(
                         f"non-relative include paths not allowed ({line!r} given)"
                     ) from e
-
-            subpath = prepare_source(subsource)
-
-            if subpath.is_dir():
-                includes.append(generate_config(subpath))
-            elif subpath.is_file():
-                raise InvalidPlan(f"{line} is a file")
-            else:
-                raise InvalidPlan(f"{line} not found")
+            subsources[line] = subsource
 
         elif SEPARATOR in line:
             left, _, right = line.partition(SEPARATOR)
-            paths[Path(left.strip())] = Path(right.strip())
+            if is_pattern(right := right.strip()):
+                paths.update(expand(right, Path(left.strip()), entries()))
+            else:
+                paths[Path(left.strip())] = Path(right)
 
         elif line := line.strip():
-            paths[Path(line)] = Path(line)
+            if is_pattern(line):
+                paths.update(expand(line, None, entries()))
+            else:
+                paths[Path(line)] = Path(line)
+
+    external = [s for s in subsources.values() if tree is None or not s.path]
+    prepared = dict(zip(external, prepare_sources(external, checkout)))
+
+    includes: list[Config] = []
+    for line, subsource in subsources.items():
+        if tree is not None and subsource.path:
+            subpath: Path | Tree = tree.subtree(subsource.path.relative_to(root))
+        else:
+            subpath = prepared[subsource]
+
+        if isinstance(subpath, Tree):
+            if subpath.is_dir(Path()):
+                includes.append(generate_config(subpath.root, subpath, checkout))
+                continue
+            is_file = subpath.is_file(Path())
+        elif subpath.is_dir():
+            includes.append(generate_config(subpath, checkout=checkout))
+            continue
+        else:
+            is_file = subpath.is_file()
+
+        raise InvalidPlan(f"{line} is a file" if is_file else f"{line} not found")
 
     return Config(
         root=root,
         paths=paths,
         includes=includes,
+        tree=tree,
     )
 
 
@@ -86,7 +152,18 @@ def repo_cache_dir(source: Source) -> Path:
     return cache_dir
 
 
-def prepare_source(source: Source) -> Path:
+def remote_cache_dir(root: Path) -> Path:
+    """
+    Location of the synced copy of a source root, relative to the remote home.
+    """
+    return REMOTE_CACHE / f"{sha1(root.as_posix())}-{root.name}"
+
+
+async def run_git(*args: str) -> None:
+    await run_async("git", *args, timeout=GIT_TIMEOUT)
+
+
+async def prepare_source_async(source: Source) -> Path:
     if source.path:
         return source.path.resolve()
 
@@ -95,11 +172,10 @@ def prepare_source(source: Source) -> Path:
         repo_dir = repo_cache_dir(source)
         if not repo_dir.is_dir():
             repo_dir.mkdir(parents=True, exist_ok=True)
-            run("git", "clone", "--depth=1", source.url, repo_dir.as_posix())
+            await run_git("clone", "--depth=1", source.url, repo_dir.as_posix())
 
         if source.ref:
-            run(
-                "git",
+            await run_git(
                 "-C",
                 repo_dir.as_posix(),
                 "fetch",
@@ -109,8 +185,7 @@ def prepare_source(source: Source) -> Path:
                 "origin",
                 f"{source.ref}:{source.ref}",
             )
-            run(
-                "git",
+            await run_git(
                 "-C",
                 repo_dir.as_posix(),
                 "checkout",
@@ -118,8 +193,7 @@ def prepare_source(source: Source) -> Path:
                 source.ref,
             )
         else:
-            run(
-                "git",
+            await run_git(
                 "-C",
                 repo_dir.as_posix(),
                 "pull",
@@ -131,53 +205,342 @@ def prepare_source(source: Source) -> Path:
     raise RuntimeError("unknown source value")
 
 
-def resolve_paths(config: Config, out: Path) -> Generator[Pair, None, None]:
+async def prepare_tree_async(source: Source) -> GitTree:
+    """
+    Fetch a git source into a bare repo, without checking out a working tree.
+    """
+    assert source.url is not None
+    cache_dir = repo_cache_dir(source)
+    repo_dir = cache_dir.with_name(f"{cache_dir.name}.git")
+    if not repo_dir.is_dir():
+        repo_dir.mkdir(parents=True, exist_ok=True)
+        await run_git("init", "--bare", "--quiet", repo_dir.as_posix())
+        await run_git("-C", repo_dir.as_posix(), "remote", "add", "origin", source.url)
+
+    await run_git(
+        "-C",
+        repo_dir.as_posix(),
+        "fetch",
+        "--force",
+        "--depth=1",
+        "origin",
+        source.ref or "HEAD",
+    )
+    return await GitTree.open(repo_dir, "FETCH_HEAD")
+
+
+def prepare_source(source: Source) -> Path:
+    import asyncio
+
+    return asyncio.run(prepare_source_async(source))
+
+
+def prepare_sources(
+    sources: Sequence[Source], checkout: bool = True
+) -> list[Path | Tree]:
+    """
+    Prepare multiple sources concurrently, returning results in the same order.
+
+    Without ``checkout``, git sources are returned as trees read directly from
+    the repository, rather than paths to a checked out working tree.
+    Archive sources are always returned as trees.
+    """
+    if not sources:
+        return []
+
+    results: dict[Source, Path | Tree] = {}
+    fetch: list[Source] = []
+    for source in dict.fromkeys(sources):
+        if source.path and is_archive(source.path) and source.path.is_file():
+            results[source] = open_archive(source.path.resolve())
+        elif source.path:
+            results[source] = source.path.resolve()
+        else:
+            fetch.append(source)
+
+    # local sources are ready as is, so only start an event loop to fetch
+    if fetch:
+        import asyncio
+
+        async def prepare(source: Source) -> Path | Tree:
+            if source.url and not checkout:
+                return await prepare_tree_async(source)
+            return await prepare_source_async(source)
+
+        async def gather() -> list[Path | Tree]:
+            return list(await asyncio.gather(*map(prepare, fetch)))
+
+        results.update(zip(fetch, asyncio.run(gather())))
+    return [results[source] for source in sources]
+
+
+def load_config(source: Source, checkout: bool = True) -> Config:
+    (prepared,) = prepare_sources([source], checkout)
+    if isinstance(prepared, Tree):
+        return generate_config(prepared.root, prepared, checkout)
+    return generate_config(prepared, checkout=checkout)
+
+
+def resolve_entries(
+    config: Config, out: Path
+) -> Generator[tuple[Config, Path, Path], None, None]:
+    """
+    Yield each mapped source path, relative to its config root, and destination.
+    """
     out = out.resolve()
 
     for include in config.includes:
-        yield from resolve_paths(include, out)
+        yield from resolve_entries(include, out)
 
     for left, right in config.paths.items():
-        src = config.root / right
-        dest = out / left
-        yield src, dest
+        yield config, right, out / left
 
 
-def resolve_actions(config: Config, target: Target, method: Method) -> list[Action]:
-    actions: list[Action] = []
+def resolve_paths(config: Config, out: Path) -> Generator[Pair, None, None]:
+    for subconfig, path, dest in resolve_entries(config, out):
+        yield subconfig.root / path, dest
+
+
+def sync_roots(config: Config) -> list[Path]:
+    """
+    Find the minimal set of source roots that contain every config and include.
+    """
+    roots: list[Path] = []
+    pending = [config]
+    while pending:
+        current = pending.pop()
+        roots.append(current.root)
+        pending.extend(current.includes)
+
+    result: list[Path] = []
+    for root in sorted(set(roots)):
+        if not any(root == r or r in root.parents for r in result):
+            result.append(root)
+    return result
+
+
+def resolve_remote_symlinks(config: Config, target: Target) -> list[Action]:
+    roots = sync_roots(config)
+    actions: list[Action] = [
+        RSync(root, Target(remote_cache_dir(root), host=target.host, user=target.user))
+        for root in roots
+    ]
+
+    anchor = Path("/").resolve()
+    index: DestinationIndex[tuple[Path, Path]] = DestinationIndex()
+    for src, dest in resolve_paths(config, anchor):
+        if is_template(src):
+            raise InvalidPlan(f"cannot symlink to template {src}, deploy a copy")
+        rel = dest.relative_to(anchor)
+        for root in roots:
+            if root == src or root in src.parents:
+                link = (
+                    remote_cache_dir(root) / src.relative_to(root),
+                    target.path / rel,
+                )
+                index.add(rel, src, link)
+                break
+        else:
+            raise InvalidPlan(f"{src} is outside of source roots")
+
+    index.validate()
+    actions.append(RemoteSymlinks(target, list(index.values())))
+    return actions
+
+
+def resolve_actions(
+    config: Config,
+    target: Target,
+    method: Method,
+    resumable: bool = False,
+    remote_symlink: bool = False,
+    atomic: bool = False,
+) -> list[Action]:
+    if target.remote and remote_symlink:
+        return resolve_remote_symlinks(config, target)
+
+    if atomic:
+        if target.remote:
+            raise InvalidPlan(f"atomic deploys not supported for remote {target}")
+        method = Method.copy
 
     if target.remote:
+        from tempfile import TemporaryDirectory
+
         td = TemporaryDirectory(prefix="dotlink-target-")
         atexit.register(td.cleanup)
-        staging = Path(td.name).resolve()
-        pairs = resolve_paths(config, staging)
+        staging = out = Path(td.name).resolve()
         method = Method.copy
     else:
-        pairs = resolve_paths(config, target.path)
+        out = target.path.resolve()
+
+    # index destinations to find conflicts before anything is touched
+    index: DestinationIndex[Copy] = DestinationIndex()
+    variables = template_variables(target)
+    for subconfig, path, dest in resolve_entries(config, out):
+        action: Copy
+        if is_template(path):
+            action = Template(subconfig.root / path, dest, variables, subconfig.tree)
+        elif method == Method.copy:
+            if subconfig.tree is not None:
+                action = Extract(subconfig.tree, path, dest)
+            else:
+                action = Copy(subconfig.root / path, dest)
+        elif method == Method.symlink:
+            if subconfig.tree is not None:
+                raise InvalidPlan(
+                    f"cannot symlink to {subconfig.root} without checkout"
+                )
+            action = Symlink(subconfig.root / path, dest)
+        else:
+            raise ValueError(f"unknown {method = !r}")
+        if dest == out or out in dest.parents:
+            index.add(dest.relative_to(out), subconfig.root / path, action)
+        elif target.remote or atomic:
+            # remote and atomic deploys can only place files within the target
+            raise InvalidPlan(f"destination {dest} is outside of {target}")
+        else:
+            index.add(dest, subconfig.root / path, action)
 
-    if method == Method.copy:
-        actions += (Copy(src, dest) for src, dest in pairs)
-    elif method == Method.symlink:
-        actions += (Symlink(src, dest) for src, dest in pairs)
-    else:
-        raise ValueError(f"unknown {method = !r}")
+    index.validate()
+    if atomic:
+        return [Generation(out, list(index.values()))]
+    actions: list[Action] = list(index.values())
 
     if target.remote:
-        actions += [SSHTarball(staging, target)]
+        if resumable:
+            actions += [SSHChunked(staging, target)]
+        else:
+            actions += [SSHTarball(staging, target)]
 
     return actions
 
 
-def dotlink(source: Source, target: Target, method: Method) -> Plan:
+def execute_plans(plans: Sequence[Plan]) -> Generator[Action, None, None]:
+    """
+    Execute multiple plans concurrently, yielding actions as they complete.
+
+    Every plan is prepared before any plan starts executing.
+    """
+    for plan in plans:
+        plan.prepare()
+
+    if len(plans) == 1:
+        yield from plans[0].execute(prepare=False)
+        return
+
+    queue: Queue[Action | BaseException | None] = Queue()
+
+    def worker(plan: Plan) -> None:
+        try:
+            for action in plan.execute(prepare=False):
+                queue.put(action)
+        except BaseException as e:
+            queue.put(e)
+        finally:
+            queue.put(None)
+
+    threads = [threading.Thread(target=worker, args=(plan,)) for plan in plans]
+    for thread in threads:
+        thread.start()
+
+    remaining = len(threads)
+    error: BaseException | None = None
+    while remaining:
+        item = queue.get()
+        if item is None:
+            remaining -= 1
+        elif isinstance(item, BaseException):
+            error = error or item
+        else:
+            yield item
+
+    for thread in threads:
+        thread.join()
+    if error:
+        raise error
+
+
+def target_key(target: Target) -> Path:
+    """
+    Comparable path of a target, with remote paths relative to the remote home.
+    """
+    if not target.remote:
+        return target.path.resolve()
+    parts = target.path.parts
+    return Path(*parts[1:]) if parts[:1] == ("~",) else target.path
+
+
+def check_targets(targets: Sequence[Target]) -> None:
+    """
+    Reject targets that are the same as, or nested within, another target.
+
+    Plans for each target are executed concurrently, so overlapping targets would
+    write to the same destinations at the same time.
+    """
+    keys = [(target.address, target_key(target)) for target in targets]
+    for i, (address, key) in enumerate(keys):
+        for j, (other_address, other_key) in enumerate(keys[:i]):
+            if address != other_address:
+                continue
+            if key == other_key:
+                raise InvalidPlan(f"target {targets[i]} is the same as {targets[j]}")
+            if other_key in key.parents:
+                raise InvalidPlan(f"target {targets[i]} is within {targets[j]}")
+            if key in other_key.parents:
+                raise InvalidPlan(f"target {targets[j]} is within {targets[i]}")
+
+
+def dotlink_targets(
+    source: Source,
+    targets: Sequence[Target],
+    method: Method,
+    resumable: bool = False,
+    remote_symlink: bool = False,
+    atomic: bool = False,
+) -> list[Plan]:
+    """
+    Prepare the source and generate its config once, then plan each target.
+    """
     LOG.debug("source = %r", source)
-    LOG.debug("target = %r", target)
+    LOG.debug("targets = %r", targets)
     LOG.debug("method = %r", method)
+    check_targets(targets)
+
+    # only symlinks need a checked out working tree to point at
+    checkout = remote_symlink or (
+        method == Method.symlink
+        and not atomic
+        and not all(target.remote for target in targets)
+    )
+    config = load_config(source, checkout)
+    plans = [
+        Plan(
+            actions=resolve_actions(
+                config, target, method, resumable, remote_symlink, atomic
+            )
+        )
+        for target in targets
+    ]
 
-    root = prepare_source(source)
-    config = generate_config(root)
-    LOG.debug("config = %s", pformat(config, indent=2))
+    if LOG.isEnabledFor(logging.DEBUG):
+        from pprint import pformat
 
-    plan = Plan(actions=resolve_actions(config, target, method))
-    LOG.debug("plan = %s", pformat(plan, indent=2))
+        LOG.debug("config = %s", pformat(config, indent=2))
+        LOG.debug("plans = %s", pformat(plans, indent=2))
 
+    return plans
+
+
+def dotlink(
+    source: Source,
+    target: Target,
+    method: Method,
+    resumable: bool = False,
+    remote_symlink: bool = False,
+    atomic: bool = False,
+) -> Plan:
+    (plan,) = dotlink_targets(
+        source, [target], method, resumable, remote_symlink, atomic
+    )
     return plan
@@ -0,0 +1,128 @@
+# Copyright Amethyst Reese
+# Licensed under the MIT license
+
+from __future__ import annotations
+
+import difflib
+import os
+from concurrent.futures import as_completed, ThreadPoolExecutor
+from functools import partial
+from pathlib import Path
+from typing import Callable, Generator, Sequence, Tuple, Union
+
+from .actions import Action, compare_files, Copy, Extract, Generation, Plan, Template
+from .templates import render_bytes
+
+DIFF_SIZE_LIMIT = 1024 * 1024
+
+NewContent = Union[Path, Callable[[], bytes]]
+Change = Tuple[NewContent, Path, str]
+
+
+def file_changes(action: Action) -> list[Change]:
+    """
+    New content for each file an action would write, its destination, and a label.
+    """
+    if isinstance(action, Generation):
+        return [change for inner in action.actions for change in file_changes(inner)]
+    if isinstance(action, Template):
+        rendered = partial(render_bytes, action.read(), action.variables)
+        return [(rendered, action.dest, action.src.as_posix())]
+    if isinstance(action, Extract):
+        if not action.tree.exists(action.path):
+            return []
+        return [
+            (
+                partial(action.tree.read_bytes, path),
+                dest,
+                (action.tree.root / path).as_posix(),
+            )
+            for path, dest in action.files()
+        ]
+    if isinstance(action, Copy):
+        if action.dest.is_symlink() and Path(os.readlink(action.dest)) == action.src:
+            return []  # already linked to the source
+        if action.src.is_dir():
+            changes: list[Change] = []
+            for dirpath, _, filenames in os.walk(action.src):
+                for name in sorted(filenames):
+                    src = Path(dirpath) / name
+                    dest = action.dest / src.relative_to(action.src)
+                    changes.append((src, dest, src.as_posix()))
+            return changes
+        if action.src.is_file():
+            return [(action.src, action.dest, action.src.as_posix())]
+    return []
+
+
+def decode(data: bytes) -> list[str] | None:
+    if b"\0" in data:
+        return None
+    try:
+        return data.decode("utf-8").splitlines(keepends=True)
+    except UnicodeDecodeError:
+        return None
+
+
+def diff_file(
+    new: NewContent, dest: Path, label: str, content: bool = False
+) -> str | None:
+    """
+    Unified diff from a destination file to its new content, or None if unchanged.
+
+    Files are compared by size and mtime (or hash) first, so unchanged files are
+    never read. Binary files, and files over the size limit, aren't diffed.
+    """
+    if dest.is_dir():
+        return f"{dest} is a directory\n"
+    exists = dest.is_file()
+
+    if isinstance(new, Path):
+        if exists and compare_files(new, dest, content) is None:
+            return None
+        too_large = new.stat().st_size > DIFF_SIZE_LIMIT
+        data = b"" if too_large else new.read_bytes()
+    else:
+        data = new()
+        too_large = len(data) > DIFF_SIZE_LIMIT
+        if exists and dest.stat().st_size == len(data) and dest.read_bytes() == data:
+            return None
+
+    old_label = dest.as_posix() if exists else "/dev/null"
+    if too_large or (exists and dest.stat().st_size > DIFF_SIZE_LIMIT):
+        return f"Files {old_label} and {label} differ (too large to diff)\n"
+
+    old_lines = decode(dest.read_bytes()) if exists else []
+    new_lines = decode(data)
+    if old_lines is None or new_lines is None:
+        return f"Binary files {old_label} and {label} differ\n"
+
+    lines = list(difflib.unified_diff(old_lines, new_lines, old_label, label))
+    if not lines:
+        return None
+    return "".join(
+        line if line.endswith("\n") else f"{line}\n\\ No newline at end of file\n"
+        for line in lines
+    )
+
+
+def plan_diffs(
+    plans: Sequence[Plan], content: bool = False, jobs: int | None = None
+) -> Generator[str, None, None]:
+    """
+    Diff every file that would change, yielding each diff as soon as it's ready.
+    """
+    changes = [
+        change
+        for plan in plans
+        for action in plan.actions
+        for change in file_changes(action)
+    ]
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        futures = [
+            pool.submit(diff_file, new, dest, label, content)
+            for new, dest, label in changes
+        ]
+        for future in as_completed(futures):
+            if diff := future.result():
+                yield diff
@@ -0,0 +1,192 @@
+# Copyright Amethyst Reese
+# Licensed under the MIT license
+
+from __future__ import annotations
+
+import json
+import logging
+import os
+import shutil
+import stat
+from pathlib import Path
+from typing import Sequence
+
+from .types import InvalidPlan
+from .util import clone_file
+
+LOG = logging.getLogger(__name__)
+STATE_DIR = Path(".dotlink")
+GENERATIONS_DIR = STATE_DIR / "generations"
+CURRENT = STATE_DIR / "current"
+GENERATIONS_KEEP = 3
+
+
+def generations(root: Path) -> list[int]:
+    """
+    Numbers of complete generations within a destination, oldest first.
+    """
+    try:
+        names = os.listdir(root / GENERATIONS_DIR)
+    except FileNotFoundError:
+        return []
+    return sorted(
+        int(name)
+        for name in names
+        if name.isdigit() and (root / GENERATIONS_DIR / name).is_dir()
+    )
+
+
+def current_generation(root: Path) -> int | None:
+    try:
+        link = os.readlink(root / CURRENT)
+    except OSError:
+        return None
+    name = Path(link).name
+    return int(name) if name.isdigit() else None
+
+
+def generation_dir(root: Path, number: int) -> Path:
+    return root / GENERATIONS_DIR / str(number)
+
+
+def read_manifest(root: Path, number: int) -> list[Path]:
+    path = root / GENERATIONS_DIR / f"{number}.json"
+    try:
+        return [Path(entry) for entry in json.loads(path.read_text())["entries"]]
+    except (OSError, ValueError, KeyError):
+        return []
+
+
+def write_manifest(root: Path, number: int, entries: Sequence[Path]) -> None:
+    path = root / GENERATIONS_DIR / f"{number}.json"
+    tmp = path.with_name(f"{path.name}.{os.getpid()}")
+    tmp.write_text(json.dumps({"entries": [e.as_posix() for e in entries]}))
+    os.replace(tmp, path)
+
+
+def entry_link(root: Path, rel: Path) -> str:
+    """
+    Symlink target for a mapped entry, pointing through the current generation.
+    """
+    return os.path.relpath(root / CURRENT / rel, (root / rel).parent)
+
+
+def replace_symlink(path: Path, target: str) -> None:
+    tmp = path.with_name(f"{path.name}.dotlink-{os.getpid()}")
+    tmp.unlink(missing_ok=True)
+    tmp.symlink_to(target)
+    os.replace(tmp, path)
+
+
+def switch(root: Path, number: int) -> None:
+    """
+    Atomically point the current generation at another generation.
+    """
+    target = GENERATIONS_DIR.relative_to(CURRENT.parent) / str(number)
+    replace_symlink(root / CURRENT, target.as_posix())
+
+
+def link_entries(root: Path, entries: Sequence[Path], old: Sequence[Path]) -> None:
+    """
+    Link each entry through the current generation, and unlink stale entries.
+
+    Links that already point to the right place are left untouched, so that
+    switching generations doesn't need to touch them at all.
+    """
+    for rel in set(old) - set(entries):
+        link = root / rel
+        if link.is_symlink() and os.readlink(link) == entry_link(root, rel):
+            link.unlink()
+
+    for rel in entries:
+        link = root / rel
+        expected = entry_link(root, rel)
+        if link.is_symlink():
+            if os.readlink(link) == expected:
+                continue
+        elif link.is_dir():
+            raise RuntimeError(f"atomic destination {link} is a directory")
+        link.parent.mkdir(parents=True, exist_ok=True)
+        replace_symlink(link, expected)
+
+
+def collect(root: Path, keep: int = GENERATIONS_KEEP) -> list[int]:
+    """
+    Remove all but the newest generations, always keeping the current one.
+    """
+    current = current_generation(root)
+    old = [n for n in generations(root) if n != current]
+    removed = old[: max(0, len(old) - (keep - 1))]
+    for number in removed:
+        LOG.debug("removing generation %d from %s", number, root)
+        shutil.rmtree(generation_dir(root, number))
+        (root / GENERATIONS_DIR / f"{number}.json").unlink(missing_ok=True)
+    return removed
+
+
+def rollback(root: Path) -> int:
+    """
+    Switch back to the newest generation older than the current one.
+    """
+    current = current_generation(root)
+    older = [n for n in generations(root) if current is None or n < current]
+    if not older:
+        raise InvalidPlan(f"no previous generation in {root}")
+
+    number = older[-1]
+    switch(root, number)
+    old = read_manifest(root, current) if current is not None else []
+    link_entries(root, read_manifest(root, number), old)
+    return number
+
+
+def link_or_copy(src: Path, dest: Path, previous: Path | None) -> int:
+    """
+    Hardlink a file from the previous generation if unchanged, or copy it.
+
+    Returns the number of bytes copied.
+    """
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    src_stat = src.stat()
+    if previous is not None:
+        try:
+            prev_stat = previous.lstat()
+            if (
+                stat.S_ISREG(prev_stat.st_mode)
+                and prev_stat.st_size == src_stat.st_size
+                and prev_stat.st_mtime_ns == src_stat.st_mtime_ns
+                and prev_stat.st_mode == src_stat.st_mode
+            ):
+                os.link(previous, dest)
+                return 0
+        except OSError:
+            pass
+
+    size = clone_file(src, dest)
+    shutil.copystat(src, dest)
+    return size
+
+
+def link_or_write(data: bytes, mode: int, dest: Path, previous: Path | None) -> int:
+    """
+    Hardlink a file from the previous generation if it has the same content, or
+    write the data. Returns the number of bytes written.
+    """
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    if previous is not None:
+        try:
+            prev_stat = previous.lstat()
+            if (
+                stat.S_ISREG(prev_stat.st_mode)
+                and prev_stat.st_size == len(data)
+                and stat.S_IMODE(prev_stat.st_mode) == mode
+                and previous.read_bytes() == data
+            ):
+                os.link(previous, dest)
+                return 0
+        except OSError:
+            pass
+
+    dest.write_bytes(data)
+    dest.chmod(mode)
+    return len(data)
@@ -0,0 +1,94 @@
+# Copyright Amethyst Reese
+# Licensed under the MIT license
+
+from __future__ import annotations
+
+import atexit
+import json
+import logging
+import os
+import threading
+from functools import lru_cache
+from pathlib import Path
+from typing import Iterable
+
+from .util import file_hash, user_cache_dir
+
+LOG = logging.getLogger(__name__)
+HASH_CACHE_NAME = "hashes.json"
+HASH_CACHE_ENTRIES = 65536
+
+
+def stat_key(st: os.stat_result) -> str:
+    return f"{st.st_dev}:{st.st_ino}:{st.st_size}:{st.st_mtime_ns}"
+
+
+class HashCache:
+    """
+    Content hashes of files from previous runs, keyed by device, inode, size and
+    mtime, so that unchanged files are never read again.
+
+    Entries are kept in least recently used order, and the oldest are evicted
+    once the cache grows past its limit.
+    """
+
+    def __init__(self, path: Path, limit: int = HASH_CACHE_ENTRIES) -> None:
+        self.path = path
+        self.limit = limit
+        self.entries: dict[str, str] = {}
+        self.dirty = False
+        self.lock = threading.Lock()
+        try:
+            self.entries = json.loads(path.read_text())
+        except (OSError, ValueError):
+            pass
+
+    def save(self) -> None:
+        with self.lock:
+            if not self.dirty:
+                return
+            while len(self.entries) > self.limit:
+                self.entries.pop(next(iter(self.entries)))
+            try:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                tmp = self.path.with_name(f"{self.path.name}.{os.getpid()}")
+                tmp.write_text(json.dumps(self.entries))
+                os.replace(tmp, self.path)
+                self.dirty = False
+            except OSError as e:
+                LOG.debug("failed to save hash cache: %s", e)
+
+    def hash(self, path: Path) -> str:
+        """
+        Hash a file, reusing the cached hash if the file hasn't changed.
+        """
+        key = stat_key(path.stat())
+        with self.lock:
+            digest = self.entries.pop(key, None)
+            if digest is not None:
+                self.entries[key] = digest  # most recently used entries go last
+                return digest
+
+        digest = file_hash(path)
+        # only cache if the file didn't change while being hashed
+        if stat_key(path.stat()) == key:
+            with self.lock:
+                self.entries[key] = digest
+                self.dirty = True
+        return digest
+
+    def hash_many(self, paths: Iterable[Path], jobs: int | None = None) -> list[str]:
+        """
+        Hash multiple files in parallel, returning hashes in the same order.
+        """
+        from concurrent.futures import ThreadPoolExecutor
+
+        with ThreadPoolExecutor(max_workers=jobs) as pool:
+            return list(pool.map(self.hash, paths))
+
+
+@lru_cache(maxsize=None)
+def hash_cache() -> HashCache:
+    cache = HashCache(Path(user_cache_dir("dotlink")) / HASH_CACHE_NAME)
+    atexit.register(cache.save)
+    return cache
@@ -0,0 +1,139 @@
+# Copyright Amethyst Reese
+# Licensed under the MIT license
+
+"""
+Remote helper for dotlink, sent to and run by the remote host's python.
+
+This module must only use the standard library, and must not import anything
+from dotlink. It reads one JSON list of operations per line from stdin, and
+writes one JSON list of results per line to stdout.
+"""
+
+import base64
+import hashlib
+import json
+import os
+import shutil
+import stat
+import sys
+from typing import Any, Callable, Dict, List, Optional
+
+Result = Dict[str, Any]
+
+
+def expand(path: str) -> str:
+    return os.path.expanduser(path)
+
+
+def op_stat(path: str) -> Result:
+    try:
+        st = os.lstat(expand(path))
+    except FileNotFoundError:
+        return {"type": None}
+    result: Result = {
+        "size": st.st_size,
+        "mtime_ns": st.st_mtime_ns,
+        "mode": st.st_mode,
+    }
+    if stat.S_ISLNK(st.st_mode):
+        result["type"] = "symlink"
+        result["target"] = os.readlink(expand(path))
+    elif stat.S_ISDIR(st.st_mode):
+        result["type"] = "dir"
+    else:
+        result["type"] = "file"
+    return result
+
+
+def op_hash(path: str) -> Result:
+    k = hashlib.sha256()
+    with open(expand(path), "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            k.update(chunk)
+    return {"hash": k.hexdigest()}
+
+
+def op_expand(path: str) -> Result:
+    return {"path": expand(path)}
+
+
+def op_mkdir(path: str) -> Result:
+    os.makedirs(expand(path), exist_ok=True)
+    return {}
+
+
+def replace(path: str, create: Callable[[str], None]) -> None:
+    parent = os.path.dirname(path)
+    if parent:
+        os.makedirs(parent, exist_ok=True)
+    if os.path.isdir(path) and not os.path.islink(path):
+        raise IsADirectoryError("{} is a directory".format(path))
+    tmp = "{}.dotlink-{}".format(path, os.getpid())
+    create(tmp)
+    os.replace(tmp, path)
+
+
+def op_symlink(path: str, target: str) -> Result:
+    path = expand(path)
+    target = expand(target)
+    if os.path.islink(path) and os.readlink(path) == target:
+        return {}
+    replace(path, lambda tmp: os.symlink(target, tmp))
+    return {}
+
+
+def op_write(path: str, data: str, mode: Optional[int] = None) -> Result:
+    def create(tmp: str) -> None:
+        with open(tmp, "wb") as f:
+            f.write(base64.b64decode(data))
+        if mode is not None:
+            os.chmod(tmp, mode)
+
+    replace(expand(path), create)
+    return {}
+
+
+def op_delete(path: str, recursive: bool = False) -> Result:
+    path = expand(path)
+    if os.path.isdir(path) and not os.path.islink(path):
+        if recursive:
+            shutil.rmtree(path)
+        else:
+            os.rmdir(path)
+    elif os.path.lexists(path):
+        os.unlink(path)
+    return {}
+
+
+OPS: Dict[str, Callable[..., Result]] = {
+    "expand": op_expand,
+    "stat": op_stat,
+    "hash": op_hash,
+    "mkdir": op_mkdir,
+    "symlink": op_symlink,
+    "write": op_write,
+    "delete": op_delete,
+}
+
+
+def handle(request: Dict[str, Any]) -> Result:
+    args = dict(request)
+    try:
+        fn = OPS[args.pop("op")]
+        return fn(**args)
+    except Exception as e:
+        return {"error": "{}: {}".format(type(e).__name__, e)}
+
+
+def main() -> None:
+    stdin = sys.stdin.buffer
+    stdout = sys.stdout.buffer
+    for line in iter(stdin.readline, b""):
+        requests: List[Dict[str, Any]] = json.loads(line)
+        results = [handle(request) for request in requests]
+        stdout.write(json.dumps(results, separators=(",", ":")).encode() + b"\n")
+        stdout.flush()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+# Copyright Amethyst Reese
+# Licensed under the MIT license
+
+from __future__ import annotations
+
+from pathlib import Path
+from typing import Generator, Generic, TypeVar
+
+from .types import InvalidPlan
+
+T = TypeVar("T")
+
+
+class Node(Generic[T]):
+    __slots__ = ("children", "entry")
+
+    def __init__(self) -> None:
+        self.children: dict[str, Node[T]] = {}
+        self.entry: tuple[Path, Path, T] | None = None
+
+    def first(self) -> tuple[Path, Path, T]:
+        """
+        Find the first entry at or below this node.
+        """
+        node = self
+        while node.entry is None:
+            node = node.children[min(node.children)]
+        return node.entry
+
+
+class DestinationIndex(Generic[T]):
+    """
+    Path trie of planned destinations, for finding conflicts between mappings.
+
+    Each destination is added in time proportional to its depth. Conflicts are
+    collected rather than raised immediately, so they can all be reported at once.
+    """
+
+    def __init__(self) -> None:
+        self.root: Node[T] = Node()
+        self.conflicts: list[str] = []
+
+    def add(self, dest: Path, src: Path, item: T) -> None:
+        node = self.root
+        for part in dest.parts:
+            if node.entry is not None:
+                parent, parent_src, _ = node.entry
+                self.conflicts.append(
+                    f"{dest} (from {src}) is inside {parent} (from {parent_src})"
+                )
+                return
+            node = node.children.setdefault(part, Node())
+
+        if node.entry is not None:
+            _, prev_src, _ = node.entry
+            self.conflicts.append(
+                f"duplicate destination {dest} (from {prev_src} and {src})"
+            )
+        elif node.children:
+            child, child_src, _ = node.first()
+            self.conflicts.append(
+                f"{child} (from {child_src}) is inside {dest} (from {src})"
+            )
+        else:
+            node.entry = (dest, src, item)
+
+    def validate(self) -> None:
+        if self.conflicts:
+            raise InvalidPlan(
+                "conflicting destinations:\n  " + "\n  ".join(self.conflicts)
+            )
+
+    def values(self) -> Generator[T, None, None]:
+        """
+        Yield items ordered by destination, with parents before their contents.
+        """
+        pending = [self.root]
+        while pending:
+            node = pending.pop()
+            if node.entry is not None:
+                yield node.entry[2]
+            pending.extend(
+                node.children[k] for k in sorted(node.children, reverse=True)
+            )
@@ -0,0 +1,226 @@
+# Copyright Amethyst Reese
+# Licensed under the MIT license
+
+from __future__ import annotations
+
+import json
+import logging
+import os
+import re
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Iterable, Sequence, Tuple
+
+from typing_extensions import TypeAlias
+
+from .util import user_cache_dir
+
+LOG = logging.getLogger(__name__)
+MAGIC = frozenset("*?[{")
+WALK_CACHE_NAME = "walk.json"
+WALK_CACHE_ROOTS = 64
+IGNORED_NAMES = frozenset({".git"})
+
+Entry: TypeAlias = Tuple[str, bool]
+
+
+def is_pattern(value: str) -> bool:
+    return any(c in MAGIC for c in value)
+
+
+def literal_prefix(pattern: str) -> Path:
+    """
+    Leading path components of a pattern that contain no glob syntax.
+    """
+    parts: list[str] = []
+    for part in pattern.split("/"):
+        if is_pattern(part):
+            break
+        parts.append(part)
+    return Path(*parts)
+
+
+def _translate(pattern: str) -> str:
+    result = ""
+    i = 0
+    n = len(pattern)
+    while i < n:
+        c = pattern[i]
+        if pattern.startswith("**/", i):
+            result += "(?:.*/)?"
+            i += 3
+            continue
+        elif pattern.startswith("**", i):
+            result += ".*"
+            i += 2
+            continue
+        elif c == "*":
+            result += "[^/]*"
+        elif c == "?":
+            result += "[^/]"
+        elif c == "[" and (end := pattern.find("]", i + 2)) != -1:
+            chars = pattern[i + 1 : end].replace("\\", "\\\\")
+            if chars.startswith("!"):
+                chars = "^" + chars[1:]
+            result += f"[{chars}]"
+            i = end
+        elif c == "{":
+            depth = 0
+            options: list[str] = []
+            start = i + 1
+            for j in range(i, n):
+                if pattern[j] == "{":
+                    depth += 1
+                elif pattern[j] == "}":
+                    depth -= 1
+                    if depth == 0:
+                        options.append(pattern[start:j])
+                        break
+                elif pattern[j] == "," and depth == 1:
+                    options.append(pattern[start:j])
+                    start = j + 1
+            else:
+                raise ValueError(f"unbalanced braces in pattern {pattern!r}")
+            result += "(?:" + "|".join(_translate(o) for o in options) + ")"
+            i = j
+        else:
+            result += re.escape(c)
+        i += 1
+    return result
+
+
+@lru_cache(maxsize=None)
+def compile_pattern(pattern: str) -> re.Pattern[str]:
+    """
+    Compile a glob pattern to a regex matching relative posix paths.
+
+    Supports ``*`` and ``?`` within one path component, ``**`` across any number
+    of components, ``[abc]`` character classes, and ``{a,b}`` alternatives.
+    """
+    return re.compile(_translate(pattern.strip("/")) + r"\Z", re.DOTALL)
+
+
+def match(pattern: str, entries: Iterable[Entry]) -> list[str]:
+    """
+    Find the paths matching a pattern, skipping anything inside a matched directory.
+    """
+    regex = compile_pattern(pattern)
+    matched: list[str] = []
+    matched_dirs: set[str] = set()
+    for path, is_dir in sorted(entries):
+        parts = path.split("/")
+        if any("/".join(parts[:i]) in matched_dirs for i in range(1, len(parts))):
+            continue
+        if regex.match(path):
+            matched.append(path)
+            if is_dir:
+                matched_dirs.add(path)
+    return matched
+
+
+def expand(
+    pattern: str, dest: Path | None, entries: Iterable[Entry]
+) -> dict[Path, Path]:
+    """
+    Map each path matching a pattern to its destination.
+
+    Without a destination, matches keep their own path. Otherwise, the part of
+    each match after the pattern's literal prefix is placed within ``dest``.
+    """
+    prefix = literal_prefix(pattern)
+    result: dict[Path, Path] = {}
+    for path in match(pattern, entries):
+        src = Path(path)
+        result[src if dest is None else dest / src.relative_to(prefix)] = src
+    return result
+
+
+class WalkCache:
+    """
+    Directory listings from previous walks, keyed by directory mtime.
+
+    Directories whose mtime hasn't changed reuse their cached listing instead of
+    being scanned again, so unchanged trees only cost one stat per directory.
+    """
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self.roots: dict[str, dict[str, Any]] = {}
+        self.dirty = False
+        try:
+            self.roots = json.loads(path.read_text())
+        except (OSError, ValueError):
+            pass
+
+    def save(self) -> None:
+        if not self.dirty:
+            return
+        # keep only the most recently walked roots
+        while len(self.roots) > WALK_CACHE_ROOTS:
+            self.roots.pop(next(iter(self.roots)))
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.path.with_name(f"{self.path.name}.{os.getpid()}")
+            tmp.write_text(json.dumps(self.roots))
+            os.replace(tmp, self.path)
+            self.dirty = False
+        except OSError as e:
+            LOG.debug("failed to save walk cache: %s", e)
+
+    def walk(self, root: Path, ignore: Sequence[str] = ()) -> list[Entry]:
+        """
+        List every file and directory below root, as relative posix paths.
+        """
+        key = root.as_posix()
+        old = self.roots.pop(key, {})
+        new: dict[str, Any] = {}
+        entries: list[Entry] = []
+        pending = [""]
+
+        while pending:
+            rel = pending.pop()
+            path = root / rel if rel else root
+            try:
+                mtime = os.stat(path).st_mtime_ns
+            except OSError:
+                continue
+
+            cached = old.get(rel)
+            if cached and cached[0] == mtime:
+                listing = cached[1]
+            else:
+                with os.scandir(path) as it:
+                    listing = sorted(
+                        [entry.name, entry.is_dir(follow_symlinks=False)]
+                        for entry in it
+                    )
+                self.dirty = True
+            new[rel] = [mtime, listing]
+
+            for name, is_dir in listing:
+                if name in IGNORED_NAMES or (not rel and name in ignore):
+                    continue
+                child = f"{rel}/{name}" if rel else name
+                entries.append((child, is_dir))
+                if is_dir:
+                    pending.append(child)
+
+        self.dirty = self.dirty or new.keys() != old.keys()
+        self.roots[key] = new  # most recently used roots go last
+        return entries
+
+
+@lru_cache(maxsize=None)
+def walk_cache() -> WalkCache:
+    return WalkCache(Path(user_cache_dir("dotlink")) / WALK_CACHE_NAME)
+
+
+def tree_entries(files: Iterable[Path]) -> list[Entry]:
+    """
+    Convert a list of files into walk entries, including their parent directories.
+    """
+    entries: set[Entry] = set()
+    for file in files:
+        entries.add((file.as_posix(), False))
+        entries.update((p.as_posix(), True) for p in file.parents if p != Path())
+    return sorted(entries)
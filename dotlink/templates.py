@@ -0,0 +1,130 @@
+# Copyright Amethyst Reese
+# Licensed under the MIT license
+
+from __future__ import annotations
+
+import getpass
+import hashlib
+import json
+import os
+import platform
+import re
+import threading
+import time
+from pathlib import Path
+from typing import Mapping
+
+from .types import InvalidPlan, Target
+from .util import user_cache_dir
+
+TEMPLATE_SUFFIX = ".tmpl"
+RENDER_CACHE_AGE = 7 * 24 * 60 * 60
+VARIABLE_REGEX = re.compile(r"\{\{\s*([A-Za-z_][\w.]*)\s*\}\}")
+
+
+def is_template(path: Path) -> bool:
+    return path.name.endswith(TEMPLATE_SUFFIX)
+
+
+def template_variables(target: Target) -> dict[str, str]:
+    """
+    Variables available to templates deployed to the given target.
+
+    ``host`` and ``user`` describe the target, and ``env.NAME`` values come from
+    the local environment.
+    """
+    variables = {
+        "host": target.host or platform.node(),
+        "user": target.user or getpass.getuser(),
+    }
+    variables.update((f"env.{k}", v) for k, v in os.environ.items())
+    return variables
+
+
+def render(template: str, variables: Mapping[str, str]) -> str:
+    """
+    Replace ``{{ name }}`` markers with their values.
+    """
+
+    def replace(match: re.Match[str]) -> str:
+        try:
+            return variables[match.group(1)]
+        except KeyError:
+            raise InvalidPlan(f"unknown template variable {match.group(1)!r}") from None
+
+    return VARIABLE_REGEX.sub(replace, template)
+
+
+def decode(template: bytes) -> str:
+    try:
+        return template.decode("utf-8")
+    except UnicodeDecodeError as e:
+        raise InvalidPlan(f"template is not valid utf-8 ({e})") from None
+
+
+def render_cache_dir() -> Path:
+    return Path(user_cache_dir("dotlink")) / "renders"
+
+
+def render_path(template: bytes, variables: Mapping[str, str]) -> Path:
+    """
+    Cache path for a render of the template, keyed by the template and the
+    values of the variables it references.
+    """
+    text = decode(template)
+    names = sorted(set(VARIABLE_REGEX.findall(text)))
+    used = {name: variables.get(name) for name in names}
+
+    k = hashlib.sha256(template)
+    k.update(json.dumps(used, sort_keys=True).encode("utf-8"))
+    return render_cache_dir() / k.hexdigest()
+
+
+def render_cached(template: bytes, variables: Mapping[str, str]) -> Path:
+    """
+    Render a template, reusing a cached render of the same template and variables.
+
+    Only variables referenced by the template contribute to the cache key, so
+    unrelated changes (like environment variables) don't invalidate renders.
+    Renders may contain secrets from the environment, so they are only readable
+    by the current user, and are evicted once unused for a while.
+    """
+    path = render_path(template, variables)
+    if path.is_file():
+        os.utime(path)  # recently used renders are kept from eviction
+        return path
+
+    rendered = render(decode(template), variables)
+    path.parent.mkdir(mode=0o700, parents=True, exist_ok=True)
+    path.parent.chmod(0o700)
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}")
+    fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "wb") as f:
+        f.write(rendered.encode("utf-8"))
+    os.replace(tmp, path)
+
+    evict_renders(path.parent)
+    return path
+
+
+def render_bytes(template: bytes, variables: Mapping[str, str]) -> bytes:
+    """
+    Render a template without writing to the cache, reusing a cached render.
+    """
+    try:
+        return render_path(template, variables).read_bytes()
+    except FileNotFoundError:
+        return render(decode(template), variables).encode("utf-8")
+
+
+def evict_renders(cache_dir: Path, max_age: float = RENDER_CACHE_AGE) -> None:
+    """
+    Remove cached renders that haven't been used within the max age, in seconds.
+    """
+    cutoff = time.time() - max_age
+    for path in cache_dir.iterdir():
+        try:
+            if path.stat().st_mtime < cutoff:
+                path.unlink()
+        except OSError:
+            pass  # removed or replaced concurrently
@@ -1,16 +1,36 @@
 # Copyright Amethyst Reese
 # Licensed under the MIT license
 
+from __future__ import annotations
+
+import gzip
+import hashlib
 import os
 import platform
+import re
+import shlex
+import subprocess
 import tarfile
 from io import BytesIO
 from pathlib import Path
 from tempfile import TemporaryDirectory
 from unittest import skipIf, TestCase
-from unittest.mock import Mock, patch
-
-from ..actions import Action, Copy, Deploy, Plan, SSHTarball, Symlink
+from unittest.mock import AsyncMock, Mock, patch
+
+from ..actions import (
+    Action,
+    Copy,
+    Deploy,
+    Plan,
+    RemoteSymlinks,
+    RSync,
+    SSH_TIMEOUT,
+    SSHChunked,
+    SSHTarball,
+    Symlink,
+)
+from ..agent import Agent
+from ..hashes import HashCache
 from ..types import Target
 
 CONTENT = "hello world\n"
@@ -34,6 +54,37 @@ class ActionsTest(TestCase):
             ]
         )
 
+    def test_plan_report(self) -> None:
+        with TemporaryDirectory() as td:
+            tdp = Path(td).resolve()
+            (tdp / "src").write_text(CONTENT)
+            (tdp / "dir").mkdir()
+            (tdp / "dir" / "a").write_text(CONTENT)
+            (tdp / "dir" / "b").write_text(CONTENT * 2)
+            plan = Plan(
+                [
+                    Copy(tdp / "src", tdp / "out" / "src"),
+                    Copy(tdp / "dir", tdp / "out" / "dir"),
+                ]
+            )
+
+            copy, tree = list(plan.execute())
+            assert copy.size == len(CONTENT)
+            assert tree.size == len(CONTENT) * 3
+            assert copy.elapsed is not None
+            assert re.fullmatch(r"12 B in \d+\.\d\ds, \d+(\.\d)? \w+/s", copy.report())
+            assert Action().report() == ""
+            assert (tdp / "out" / "dir" / "b").read_text() == CONTENT * 2
+
+            with self.subTest("failure"):
+                plan = Plan([Action("broken")])
+                with self.assertLogs("dotlink.actions", "ERROR") as logs:
+                    with self.assertRaises(NotImplementedError):
+                        list(plan.execute())
+                assert logs.output == [
+                    "ERROR:dotlink.actions:failed: Action: ('broken',), {}"
+                ]
+
     def test_action(self) -> None:
         action = Action(1, 37, value="hello")
         assert str(action) == r"Action: (1, 37), {'value': 'hello'}"
@@ -222,11 +273,150 @@ class ActionsTest(TestCase):
                 ):
                     action.prepare()
 
+    @patch("dotlink.actions.hash_cache")
+    def test_check(self, hash_mock: Mock) -> None:
+        with TemporaryDirectory() as td:
+            tdp = Path(td).resolve()
+            hash_mock.return_value = HashCache(tdp / "hashes.json")
+            (src := tdp / "foo").write_text(CONTENT)
+            (srcdir := tdp / "in").mkdir()
+            (srcdir / "a").write_text(CONTENT)
+            dest = tdp / "bar"
+            destdir = tdp / "out"
+
+            with self.subTest("copy missing"):
+                assert Copy(src, dest).check() == "missing"
+                assert Copy(srcdir, destdir).check() == "missing"
+                assert Copy(tdp / "nope", dest).check() == "source missing"
+
+            with self.subTest("copy current"):
+                for action in (Copy(src, dest), Copy(srcdir, destdir)):
+                    action.prepare()
+                    action.execute()
+                    assert action.check() is None
+                    assert action.check(content=True) is None
+
+            with self.subTest("copy drift"):
+                dest.write_text("hi\n")
+                assert Copy(src, dest).check() == "size"
+                dest.write_text("hello earth\n")
+                assert Copy(src, dest).check() is None
+                assert Copy(src, dest).check(content=True) == "content"
+                os.utime(dest, ns=(0, 0))
+                assert Copy(src, dest).check() == "mtime"
+                (destdir / "a").unlink()
+                assert Copy(srcdir, destdir).check() == "a: missing"
+
+            with self.subTest("plan"):
+                plan = Plan(actions=[Copy(src, dest), Copy(src, tdp / "baz")])
+                assert [(str(a), d) for a, d in plan.check()] == [
+                    (f"Copy: {src} -> {dest}", "mtime"),
+                    (f"Copy: {src} -> {tdp / 'baz'}", "missing"),
+                ]
+                assert plan.checked_actions() == plan.actions
+
+    @skipIf(platform.system() == "Windows", "symlinks unsupported on windows")
+    def test_check_symlink(self) -> None:
+        with TemporaryDirectory() as td:
+            tdp = Path(td).resolve()
+            (src := tdp / "foo").write_text(CONTENT)
+            dest = tdp / "bar"
+
+            action = Symlink(src, dest)
+            assert action.check() == "missing"
+            action.prepare()
+            action.execute()
+            assert action.check() is None
+
+            assert Symlink(tdp / "other", dest).check() == f"points to {src}"
+            assert Copy(src, dest).check() == "symlink"
+
+            dest.unlink()
+            dest.write_text(CONTENT)
+            assert action.check() == "not a symlink"
+
     def test_deploy(self) -> None:
         assert Deploy is Deploy  # TODO
 
-    @patch("dotlink.actions.run")
-    def test_sshtarball(self, run_mock: Mock) -> None:
+    @patch("dotlink.actions.Agent.ssh", side_effect=lambda target: Agent.local())
+    def test_check_remote(self, ssh_mock: Mock) -> None:
+        with TemporaryDirectory() as td:
+            tdp = Path(td).resolve()
+            staging = tdp / "staging"
+            remote = tdp / "remote"
+            (staging / "dir").mkdir(parents=True)
+            (staging / "foo").write_text(CONTENT)
+            (staging / "dir" / "bar").write_text(CONTENT)
+            (staging / ".git").mkdir()
+            (staging / ".git" / "HEAD").write_text(CONTENT)
+            target = Target(remote, host="host")
+
+            plan = Plan(
+                [Copy(staging / "foo", staging / "baz"), SSHTarball(staging, target)]
+            )
+            action = plan.actions[1]
+            assert plan.checked_actions() == [action]
+
+            with self.subTest("missing"):
+                assert list(plan.check()) == [(action, "baz: missing")]
+                ssh_mock.assert_called_with(target)
+
+            (remote / "dir").mkdir(parents=True)
+            for name in ("baz", "foo", "dir/bar"):
+                (remote / name).write_text(CONTENT)
+
+            with self.subTest("clean"):
+                assert list(plan.check()) == []
+                assert list(plan.check(content=True)) == []
+
+            with self.subTest("content"):
+                (remote / "dir" / "bar").write_text(CONTENT.upper())
+                assert list(plan.check()) == []
+                assert list(plan.check(content=True)) == [(action, "dir/bar: content")]
+
+            with self.subTest("size"):
+                (remote / "foo").write_text("hi\n")
+                assert list(plan.check()) == [(action, "foo: size")]
+
+            with self.subTest("not a file"):
+                (remote / "foo").unlink()
+                (remote / "foo").mkdir()
+                assert list(plan.check()) == [(action, "foo: not a file")]
+
+    @skipIf(platform.system() == "Windows", "symlinks unsupported on windows")
+    @patch("dotlink.actions.Agent.ssh", side_effect=lambda target: Agent.local())
+    def test_check_remote_symlinks(self, ssh_mock: Mock) -> None:
+        with TemporaryDirectory() as td:
+            tdp = Path(td).resolve()
+            target = Target(tdp, host="host")
+            vimrc = tdp / ".vimrc"
+            zshrc = tdp / ".config" / "zshrc"
+            action = RemoteSymlinks(
+                target, [(Path("cache/vimrc"), vimrc), (Path("cache/zshrc"), zshrc)]
+            )
+
+            with patch.dict(os.environ, {"HOME": tdp.as_posix()}):
+                assert action.check() == f"{vimrc}: missing"
+                vimrc.symlink_to(tdp / "cache" / "vimrc")
+                zshrc.parent.write_text(CONTENT)
+                assert action.check() == f"{zshrc}: NotADirectoryError: " + (
+                    f"[Errno 20] Not a directory: '{zshrc}'"
+                )
+                zshrc.parent.unlink()
+                zshrc.parent.mkdir()
+                zshrc.symlink_to(tdp / "cache" / "other")
+                assert action.check() == f"{zshrc}: points to {tdp / 'cache' / 'other'}"
+                zshrc.unlink()
+                zshrc.symlink_to(tdp / "elsewhere" / "cache" / "zshrc")
+                assert action.check() == (
+                    f"{zshrc}: points to {tdp / 'elsewhere' / 'cache' / 'zshrc'}"
+                )
+                zshrc.unlink()
+                zshrc.symlink_to(tdp / "cache" / "zshrc")
+                assert action.check() is None
+
+    @patch("dotlink.actions.run_async")
+    def test_sshtarball(self, run_mock: AsyncMock) -> None:
         with TemporaryDirectory() as td:
             tdp = Path(td).resolve()
 
@@ -248,7 +438,7 @@ class ActionsTest(TestCase):
                     "-C",
                     "/target",
                     input=action.data,
-                    encoding=None,
+                    timeout=SSH_TIMEOUT,
                 )
                 run_mock.reset_mock()
 
@@ -277,7 +467,7 @@ class ActionsTest(TestCase):
                     "-C",
                     "/target",
                     input=action.data,
-                    encoding=None,
+                    timeout=SSH_TIMEOUT,
                 )
                 run_mock.reset_mock()
 
@@ -291,3 +481,140 @@ class ActionsTest(TestCase):
                 action = SSHTarball(tdp, Target(Path("/foo")))
                 with self.assertRaisesRegex(ValueError, "target /foo is not remote"):
                     action.prepare()
+
+    @patch("dotlink.actions.run_async")
+    def test_rsync(self, run_mock: AsyncMock) -> None:
+        with TemporaryDirectory() as td:
+            tdp = Path(td).resolve()
+            action = RSync(tdp, Target(Path(".cache/x"), host="host", user="user"))
+            action.prepare()
+            action.execute()
+            run_mock.assert_called_once_with(
+                "rsync",
+                "--archive",
+                "--delete",
+                "--exclude=/.git",
+                "--rsync-path=mkdir -p .cache/x && rsync",
+                "-e",
+                "ssh",
+                f"{tdp.as_posix()}/",
+                "user@host:.cache/x/",
+                timeout=SSH_TIMEOUT,
+            )
+
+            with self.assertRaisesRegex(ValueError, "is not remote"):
+                RSync(tdp, Target(Path("/foo"))).prepare()
+
+    @skipIf(platform.system() == "Windows", "symlinks unsupported on windows")
+    @patch("dotlink.actions.Agent.ssh", side_effect=lambda target: Agent.local())
+    def test_remote_symlinks(self, ssh_mock: Mock) -> None:
+        with TemporaryDirectory() as td:
+            home = Path(td).resolve()
+            (home / "cache").mkdir()
+            (home / "cache" / "vimrc").write_text(CONTENT)
+            (home / "cache" / "my zshrc").write_text(CONTENT)
+            target = Target(home / "out", host="host")
+            vimrc = home / "out" / ".vimrc"
+            zshrc = home / "out" / ".config" / "zsh" / ".zshrc"
+            action = RemoteSymlinks(
+                target,
+                [(Path("cache/vimrc"), vimrc), (Path("cache/my zshrc"), zshrc)],
+            )
+            action.prepare()
+
+            with patch.dict(os.environ, {"HOME": home.as_posix()}):
+                with self.subTest("links"):
+                    action.execute()
+                    ssh_mock.assert_called_with(target)
+                    assert Path(os.readlink(vimrc)) == home / "cache" / "vimrc"
+                    assert Path(os.readlink(zshrc)) == home / "cache" / "my zshrc"
+                    assert zshrc.read_text() == CONTENT
+                    assert action.check() is None
+
+                with self.subTest("unchanged"):
+                    before = vimrc.lstat().st_mtime_ns
+                    action.execute()
+                    assert vimrc.lstat().st_mtime_ns == before
+
+                with self.subTest("directory"):
+                    vimrc.unlink()
+                    zshrc.unlink()
+                    vimrc.mkdir()
+                    with self.assertRaisesRegex(RuntimeError, "is a directory"):
+                        action.execute()
+                    assert not zshrc.is_symlink(), "nothing changed before the check"
+
+                with self.subTest("home relative"):
+                    action = RemoteSymlinks(
+                        Target(Path("~/home out"), host="host"),
+                        [(Path("cache/vimrc"), Path("~/home out/.vimrc"))],
+                    )
+                    action.execute()
+                    vimrc = home / "home out" / ".vimrc"
+                    assert Path(os.readlink(vimrc)) == home / "cache" / "vimrc"
+
+    @patch("dotlink.actions.UPLOAD_CHUNK_SIZE", 1024)
+    @patch("dotlink.actions.run_async")
+    def test_sshchunked(self, run_mock: AsyncMock) -> None:
+        with TemporaryDirectory() as td:
+            tdp = Path(td).resolve()
+            for i in range(4):
+                (tdp / f"file{i}").write_bytes(os.urandom(1000))
+
+            target = Target(Path("/target"), host="localhost")
+            action = SSHChunked(tdp, target)
+            action.prepare()
+
+            data = action.tarball()
+            assert data == action.tarball(), "tarball should be reproducible"
+            digests = [
+                hashlib.sha256(data[i : i + 1024]).hexdigest()
+                for i in range(0, len(data), 1024)
+            ]
+            uploaded: list[str] = []
+            failures = [subprocess.CalledProcessError(255, "ssh")]
+
+            async def fake_ssh(
+                *cmd: str, input: bytes | None = None, **kwargs: object
+            ) -> subprocess.CompletedProcess[bytes]:
+                assert cmd[:2] == ("ssh", "localhost")
+                script = cmd[2]
+                if script.startswith("mkdir"):
+                    # remote already has the first chunk, and any uploaded ones
+                    listing = "\n".join([digests[0], *uploaded])
+                    return subprocess.CompletedProcess(cmd, 0, listing.encode(), b"")
+                if script.startswith("cat"):
+                    assert input is not None
+                    if len(uploaded) == 2 and failures:
+                        raise failures.pop()
+                    chunk = gzip.decompress(input)
+                    uploaded.append(hashlib.sha256(chunk).hexdigest())
+                return subprocess.CompletedProcess(cmd, 0, b"", b"")
+
+            run_mock.side_effect = fake_ssh
+            action.execute()
+
+            assert sorted(uploaded) == sorted(set(digests[1:]))
+            sh, flag, extract = shlex.split(run_mock.call_args_list[-1].args[2])
+            assert (sh, flag) == ("sh", "-c")
+            assert extract.startswith("gzip -dc ")
+            assert f'"${{digest%% *}}" != {hashlib.sha256(data).hexdigest()}' in extract
+            assert "tar -x -m -f" in extract
+            assert "-C /target" in extract
+            for digest in digests:
+                assert f"{digest}.part" in extract
+
+            with self.subTest("attempts exhausted"):
+                run_mock.reset_mock()
+                run_mock.side_effect = subprocess.CalledProcessError(255, "ssh")
+                with self.assertRaises(subprocess.CalledProcessError):
+                    SSHChunked(tdp, target, attempts=2).execute()
+                assert run_mock.call_count == 2
+
+            with self.subTest("home relative"):
+                run_mock.reset_mock()
+                run_mock.side_effect = fake_ssh
+                target = Target(Path("~/my dotfiles"), host="localhost")
+                SSHChunked(tdp, target).execute()
+                _, _, extract = shlex.split(run_mock.call_args_list[-1].args[2])
+                assert "-C ~/'my dotfiles'" in extract
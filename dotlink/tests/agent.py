@@ -0,0 +1,143 @@
+# Copyright Amethyst Reese
+# Licensed under the MIT license
+
+import hashlib
+import os
+import platform
+import stat
+import sys
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from unittest import skipIf, TestCase
+from unittest.mock import patch
+
+from dotlink.agent import Agent, AgentError
+
+CONTENT = b"hello world\n"
+
+
+class AgentTest(TestCase):
+    def test_request(self) -> None:
+        with TemporaryDirectory() as td, Agent.local() as agent:
+            tdp = Path(td).resolve()
+            path = tdp / "a" / "file"
+
+            with self.subTest("empty"):
+                assert agent.request([]) == []
+
+            with self.subTest("missing"):
+                assert agent.request([Agent.stat(path)]) == [{"type": None}]
+
+            with self.subTest("file"):
+                path.parent.mkdir()
+                path.write_bytes(CONTENT)
+                results = agent.request(
+                    [Agent.stat(path), Agent.hash(path), Agent.stat(path.parent)]
+                )
+                assert results[0]["type"] == "file"
+                assert results[0]["size"] == len(CONTENT)
+                assert results[0]["mtime_ns"] == path.stat().st_mtime_ns
+                assert results[1] == {"hash": hashlib.sha256(CONTENT).hexdigest()}
+                assert results[2]["type"] == "dir"
+
+            with self.subTest("errors"):
+                results = agent.request(
+                    [
+                        Agent.hash(tdp / "nope"),
+                        Agent.hash(tdp / "a"),
+                        {"op": "format", "path": "/"},
+                        Agent.stat(path),
+                    ]
+                )
+                assert "FileNotFoundError" in results[0]["error"]
+                assert "Error" in results[1]["error"]
+                assert "KeyError" in results[2]["error"]
+                assert results[3]["type"] == "file"
+
+    def test_write(self) -> None:
+        with TemporaryDirectory() as td, Agent.local() as agent:
+            tdp = Path(td).resolve()
+            path = tdp / "a" / "b" / "file"
+
+            with self.subTest("write"):
+                results = agent.request(
+                    [
+                        Agent.mkdir(tdp / "c" / "d"),
+                        Agent.write(path, CONTENT, mode=0o755),
+                        Agent.stat(path),
+                        Agent.stat(tdp / "c" / "d"),
+                    ]
+                )
+                assert results[:2] == [{}, {}]
+                assert results[2]["type"] == "file"
+                assert results[3]["type"] == "dir"
+                assert path.read_bytes() == CONTENT
+                if platform.system() != "Windows":
+                    assert stat.S_IMODE(path.stat().st_mode) == 0o755
+
+            with self.subTest("errors"):
+                results = agent.request(
+                    [Agent.write(tdp / "c", CONTENT), Agent.mkdir(path)]
+                )
+                assert "IsADirectoryError" in results[0]["error"]
+                assert "FileExistsError" in results[1]["error"]
+
+            with self.subTest("delete"):
+                results = agent.request(
+                    [
+                        Agent.delete(path),
+                        Agent.delete(tdp / "nope"),
+                        Agent.delete(tdp / "a"),
+                        Agent.delete(tdp / "a" / "b"),
+                        Agent.delete(tdp / "a"),
+                        Agent.delete(tdp / "c", recursive=True),
+                    ]
+                )
+                assert "OSError" in results[2]["error"]
+                assert results[:2] + results[3:] == [{}, {}, {}, {}, {}]
+                assert os.listdir(tdp) == []
+
+    @skipIf(platform.system() == "Windows", "symlinks not supported")
+    def test_symlink(self) -> None:
+        with TemporaryDirectory() as td, Agent.local() as agent:
+            tdp = Path(td).resolve()
+            link = tdp / "sub" / "link"
+
+            results = agent.request(
+                [Agent.symlink(link, "one"), Agent.symlink(link, "two")]
+            )
+            assert results == [{}, {}]
+            assert os.readlink(link) == "two"
+
+            (result,) = agent.request([Agent.stat(link)])
+            assert result["type"] == "symlink"
+            assert result["target"] == "two"
+
+            with self.subTest("unchanged"):
+                before = link.lstat().st_mtime_ns
+                assert agent.request([Agent.symlink(link, "two")]) == [{}]
+                assert link.lstat().st_mtime_ns == before
+
+            with self.subTest("directory"):
+                (tdp / "dir").mkdir()
+                (result,) = agent.request([Agent.symlink(tdp / "dir", "two")])
+                assert "IsADirectoryError" in result["error"]
+
+        with TemporaryDirectory() as td:
+            home = Path(td).resolve()
+            with patch.dict(os.environ, {"HOME": home.as_posix()}):
+                with Agent.local() as agent:
+                    results = agent.request(
+                        [
+                            Agent.symlink(Path("~/link"), "~/cache/file"),
+                            Agent.expand(Path("~/cache/file")),
+                        ]
+                    )
+            assert results == [{}, {"path": (home / "cache" / "file").as_posix()}]
+            assert os.readlink(home / "link") == (home / "cache" / "file").as_posix()
+
+    def test_exited(self) -> None:
+        agent = Agent([sys.executable, "-c", "import sys; sys.stdin.readline()"])
+        with self.assertRaisesRegex(AgentError, "helper exited with 0"):
+            agent.request([Agent.stat(Path("."))])
+        agent.close()
@@ -5,10 +5,12 @@ from pathlib import Path
 from tempfile import TemporaryDirectory
 from textwrap import dedent
 from unittest import TestCase
-from unittest.mock import Mock, patch
+from unittest.mock import AsyncMock, call, Mock, patch
 
 from dotlink import core
-from dotlink.types import Config, InvalidPlan, Source
+from dotlink.actions import Copy, RemoteSymlinks, RSync
+from dotlink.patterns import WalkCache
+from dotlink.types import Config, InvalidPlan, Method, Source, Target
 
 
 class CoreTest(TestCase):
@@ -109,6 +111,34 @@ class CoreTest(TestCase):
             with self.assertRaisesRegex(InvalidPlan, "bar not found"):
                 core.generate_config(self.dir / "invalid")
 
+    def test_generate_config_patterns(self) -> None:
+        (self.dir / "bin").mkdir()
+        for name in ("tool", "other", "skip.txt"):
+            (self.dir / "bin" / name).write_text("\n")
+        (self.dir / "vim" / "ftplugin").mkdir(parents=True)
+        (self.dir / "vim" / "ftplugin" / "python.vim").write_text("\n")
+        (self.dir / "vim" / "vimrc").write_text("\n")
+        (self.dir / ".dotlink").write_text(
+            dedent(
+                """
+                .local/bin = bin/{tool,other}
+                .vim = vim/**/*.vim
+                .z*
+                """
+            )
+        )
+
+        cache = WalkCache(self.dir / "walk.json")
+        with patch("dotlink.core.walk_cache", return_value=cache):
+            config = core.generate_config(self.dir)
+        assert config.paths == {
+            Path(".local/bin/other"): Path("bin/other"),
+            Path(".local/bin/tool"): Path("bin/tool"),
+            Path(".vim/ftplugin/python.vim"): Path("vim/ftplugin/python.vim"),
+            Path(".zshrc"): Path(".zshrc"),
+        }
+        assert (self.dir / "walk.json").is_file()
+
     @patch("dotlink.core.user_cache_dir")
     def test_repo_cache_dir(self, ucd_mock: Mock) -> None:
         with TemporaryDirectory() as td:
@@ -137,6 +167,208 @@ class CoreTest(TestCase):
                     else:
                         self.assertEqual(expected, core.repo_cache_dir(source))
 
-    @patch("dotlink.core.run")
-    def test_prepare_source(self, run_mock: Mock) -> None:
-        pass
+    def test_resolve_conflicts(self) -> None:
+        (self.dir / "gitignore").write_text("\n")
+        config = core.generate_config(self.dir)
+
+        with self.subTest("duplicate"):
+            with self.assertRaisesRegex(
+                InvalidPlan,
+                r"duplicate destination \.zshrc \(from .+inner.\.zshrc and .+\)",
+            ):
+                core.resolve_actions(config, Target(self.dir / "out"), Method.copy)
+
+        with self.subTest("nested"):
+            (self.dir / ".config").mkdir()
+            (self.inner / "dotlink").write_text("Brewfile\n.config/foo = Brewfile\n")
+            (self.dir / ".dotlink").write_text(".config\n@inner\n")
+            config = core.generate_config(self.dir)
+            with self.assertRaisesRegex(
+                InvalidPlan, r"\.config.foo \(from .+\) is inside \.config"
+            ):
+                core.resolve_actions(config, Target(self.dir / "out"), Method.copy)
+
+            # reported regardless of which mapping comes first
+            (self.dir / ".dotlink").write_text("@inner\n.config\n")
+            config = core.generate_config(self.dir)
+            with self.assertRaisesRegex(
+                InvalidPlan, r"\.config.foo \(from .+\) is inside \.config"
+            ):
+                core.resolve_actions(config, Target(self.dir / "out"), Method.copy)
+
+        with self.subTest("ordered"):
+            (self.inner / "dotlink").write_text("Brewfile\n.config2/foo = Brewfile\n")
+            (self.dir / ".dotlink").write_text(".zshrc\n@inner\n.config\n.vimrc\n")
+            config = core.generate_config(self.dir)
+            actions = core.resolve_actions(
+                config, Target(self.dir / "out"), Method.copy
+            )
+            dests = []
+            for action in actions:
+                assert isinstance(action, Copy)
+                dests.append(action.dest.relative_to(self.dir / "out").as_posix())
+            assert dests == [
+                ".config",
+                ".config2/foo",
+                ".vimrc",
+                ".zshrc",
+                "Brewfile",
+            ]
+
+    def test_resolve_absolute(self) -> None:
+        (self.dir / "gitignore").write_text("\n")
+        (self.inner / "dotlink").write_text("Brewfile\n")
+        outside = self.dir / "outside" / "Brewfile"
+        (self.dir / ".dotlink").write_text(f".vimrc\n{outside.as_posix()} = .zshrc\n")
+        config = core.generate_config(self.dir)
+
+        actions = core.resolve_actions(config, Target(self.dir / "out"), Method.copy)
+        dests = []
+        for action in actions:
+            assert isinstance(action, Copy)
+            dests.append(action.dest)
+        assert sorted(dests) == sorted([self.dir / "out" / ".vimrc", outside])
+
+        with self.subTest("conflicts"):
+            (self.inner / "dotlink").write_text(f"{outside.as_posix()} = Brewfile\n")
+            (self.dir / ".dotlink").write_text(
+                f"{outside.as_posix()} = .zshrc\n@inner\n"
+            )
+            config = core.generate_config(self.dir)
+            with self.assertRaisesRegex(InvalidPlan, "duplicate destination"):
+                core.resolve_actions(config, Target(self.dir / "out"), Method.copy)
+
+        for name, target, atomic in (
+            ("remote", Target(Path("home"), host="host"), False),
+            ("atomic", Target(self.dir / "out"), True),
+        ):
+            with self.subTest(name):
+                with self.assertRaisesRegex(InvalidPlan, "is outside of"):
+                    core.resolve_actions(config, target, Method.copy, atomic=atomic)
+
+    def test_resolve_remote_symlinks(self) -> None:
+        (self.dir / "gitignore").write_text("\n")
+        (self.inner / "dotlink").write_text("Brewfile\n")
+        config = core.generate_config(self.dir)
+        assert core.sync_roots(config) == [self.dir]
+
+        target = Target.parse("user@host:home")
+        actions = core.resolve_actions(
+            config, target, Method.symlink, remote_symlink=True
+        )
+        cache = core.remote_cache_dir(self.dir)
+        assert cache.parent == core.REMOTE_CACHE
+
+        sync, links = actions
+        assert isinstance(sync, RSync)
+        assert sync.src == self.dir
+        assert sync.target == Target(cache, host="host", user="user")
+        assert isinstance(links, RemoteSymlinks)
+        assert links.target == target
+        assert links.links == [
+            (cache / "gitignore", Path("home/.gitignore")),
+            (cache / ".vimrc", Path("home/.vimrc")),
+            (cache / ".zshrc", Path("home/.zshrc")),
+            (cache / "inner" / "Brewfile", Path("home/Brewfile")),
+        ]
+
+        with self.subTest("separate roots"):
+            other = Config(root=self.dir.parent / "other", paths={Path("a"): Path("a")})
+            config = Config(root=self.inner, includes=[other])
+            assert core.sync_roots(config) == sorted([self.inner, other.root])
+
+    def test_dotlink_targets(self) -> None:
+        (self.dir / "gitignore").write_text("\n")
+        (self.inner / "dotlink").write_text("Brewfile\n")
+        outs = [self.dir / f"out{i}" for i in range(4)]
+        targets = [Target(out) for out in outs]
+
+        with patch("dotlink.core.generate_config", wraps=core.generate_config) as gc:
+            plans = core.dotlink_targets(Source(path=self.dir), targets, Method.copy)
+            # once for the source, and once for its include
+            assert gc.call_args_list == [
+                call(self.dir, checkout=False),
+                call(self.inner, checkout=False),
+            ]
+
+        assert len(plans) == 4
+        actions = list(core.execute_plans(plans))
+        assert len(actions) == sum(len(plan.actions) for plan in plans)
+        for out in outs:
+            for name in (".gitignore", ".vimrc", ".zshrc", "Brewfile"):
+                assert (out / name).is_file()
+
+        with self.subTest("overlapping"):
+            for overlapping, message in (
+                ([outs[0], outs[0]], "is the same as"),
+                ([outs[0], self.dir / "out0" / ".." / "out0"], "is the same as"),
+                ([outs[0], outs[0] / "sub"], "out0/sub is within"),
+                ([outs[0] / "sub", outs[0]], "out0/sub is within"),
+            ):
+                with self.assertRaisesRegex(InvalidPlan, message):
+                    core.dotlink_targets(
+                        Source(path=self.dir),
+                        [Target(path) for path in overlapping],
+                        Method.copy,
+                    )
+            for remotes, message in (
+                (["host:home", "host:~/home"], "is the same as"),
+                (["host:~", "host:.dotfiles"], "is within"),
+            ):
+                with self.assertRaisesRegex(InvalidPlan, message):
+                    core.check_targets([Target.parse(value) for value in remotes])
+            core.check_targets(
+                [Target(outs[0]), Target.parse("host:out0"), Target.parse("other:out0")]
+            )
+
+        with self.subTest("error"):
+            (self.dir / ".vimrc").unlink()
+            plans = core.dotlink_targets(Source(path=self.dir), targets, Method.copy)
+            with self.assertRaisesRegex(FileNotFoundError, "does not exist"):
+                list(core.execute_plans(plans))
+
+    @patch("dotlink.core.user_cache_dir")
+    @patch("dotlink.core.run_async")
+    def test_prepare_source(self, run_mock: AsyncMock, ucd_mock: Mock) -> None:
+        ucd_mock.return_value = (self.dir / "cache").as_posix()
+
+        with self.subTest("local path"):
+            assert core.prepare_source(Source.parse("inner", root=self.dir)) == (
+                self.inner
+            )
+            run_mock.assert_not_called()
+
+        with self.subTest("clone"):
+            url = "https://github.com/amyreese/dotfiles.git"
+            repo_dir = (self.dir / "cache" / "d45a-dotfiles").as_posix()
+            assert core.prepare_source(Source.parse(url)) == Path(repo_dir)
+            assert run_mock.call_args_list == [
+                call(
+                    "git",
+                    "clone",
+                    "--depth=1",
+                    url,
+                    repo_dir,
+                    timeout=core.GIT_TIMEOUT,
+                ),
+                call(
+                    "git",
+                    "-C",
+                    repo_dir,
+                    "pull",
+                    "--ff-only",
+                    timeout=core.GIT_TIMEOUT,
+                ),
+            ]
+            run_mock.reset_mock()
+
+        with self.subTest("concurrent"):
+            sources = [
+                Source.parse("https://github.com/amyreese/dotfiles.git#main"),
+                Source.parse("inner", root=self.dir),
+                Source.parse("https://github.com/amyreese/dotfiles.git#main"),
+            ]
+            main_dir = self.dir / "cache" / "d45a-dotfiles-main"
+            assert core.prepare_sources(sources) == [main_dir, self.inner, main_dir]
+            # duplicate sources are only prepared once
+            assert run_mock.call_count == 3
@@ -0,0 +1,99 @@
+# Copyright Amethyst Reese
+# Licensed under the MIT license
+
+import os
+import platform
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from unittest import skipIf, TestCase
+from unittest.mock import patch
+
+from dotlink.actions import Copy, Plan, Symlink
+from dotlink.diffs import diff_file, file_changes, plan_diffs
+from dotlink.hashes import HashCache
+
+CONTENT = "one\ntwo\nthree\n"
+
+
+class DiffsTest(TestCase):
+    def setUp(self) -> None:
+        self.td = TemporaryDirectory()
+        self.dir = Path(self.td.name).resolve()
+        self.src = self.dir / "src"
+        self.dest = self.dir / "dest"
+        self.src.write_text(CONTENT)
+
+    def tearDown(self) -> None:
+        self.td.cleanup()
+
+    def test_new_file(self) -> None:
+        diff = diff_file(self.src, self.dest, "src")
+        assert diff == "--- /dev/null\n+++ src\n@@ -0,0 +1,3 @@\n+one\n+two\n+three\n"
+
+    def test_unchanged(self) -> None:
+        self.dest.write_text(CONTENT)
+        with patch("pathlib.Path.read_bytes") as read_mock:
+            assert diff_file(self.src, self.dest, "src") is None
+            read_mock.assert_not_called()
+
+        with self.subTest("same size, newer source"):
+            self.dest.write_text(CONTENT.upper())
+            os.utime(self.dest, ns=(0, 0))
+            assert diff_file(self.src, self.dest, "src") is not None
+
+        with self.subTest("same size, hashed"):
+            self.dest.write_text(CONTENT.upper())
+            assert diff_file(self.src, self.dest, "src") is None
+            cache = HashCache(self.dir / "hashes.json")
+            with patch("dotlink.actions.hash_cache", return_value=cache):
+                assert diff_file(self.src, self.dest, "src", content=True) is not None
+
+        with self.subTest("bytes"):
+            self.dest.write_text(CONTENT)
+            assert diff_file(lambda: CONTENT.encode(), self.dest, "src") is None
+
+    def test_changed(self) -> None:
+        self.dest.write_text("one\n2\nthree")
+        diff = diff_file(self.src, self.dest, "src")
+        assert diff is not None
+        assert f"--- {self.dest.as_posix()}\n+++ src\n" in diff
+        assert "-2\n-three\n\\ No newline at end of file\n+two\n+three\n" in diff
+
+    def test_binary(self) -> None:
+        self.dest.write_bytes(b"\0\1\2")
+        assert diff_file(self.src, self.dest, "src") == (
+            f"Binary files {self.dest.as_posix()} and src differ\n"
+        )
+
+    @patch("dotlink.diffs.DIFF_SIZE_LIMIT", 4)
+    def test_too_large(self) -> None:
+        assert diff_file(self.src, self.dest, "src") == (
+            "Files /dev/null and src differ (too large to diff)\n"
+        )
+
+    def test_plan_diffs(self) -> None:
+        (self.dir / "tree").mkdir()
+        (self.dir / "tree" / "a").write_text(CONTENT)
+        (self.dir / "tree" / "b").write_text(CONTENT)
+        (self.dir / "out").mkdir()
+        (self.dir / "out" / "a").write_text(CONTENT)
+        os.utime(self.dir / "out" / "a", ns=(2**62, 2**62))
+
+        plan = Plan(
+            [Copy(self.dir / "tree", self.dir / "out"), Copy(self.src, self.dest)]
+        )
+        assert [label for _, _, label in file_changes(plan.actions[0])] == [
+            (self.dir / "tree" / "a").as_posix(),
+            (self.dir / "tree" / "b").as_posix(),
+        ]
+        diffs = list(plan_diffs([plan], jobs=2))
+        assert len(diffs) == 2
+        for src in (self.dir / "tree" / "b", self.src):
+            assert any(f"+++ {src.as_posix()}\n" in diff for diff in diffs)
+
+    @skipIf(platform.system() == "Windows", "symlinks unsupported on windows")
+    def test_symlink(self) -> None:
+        action = Symlink(self.src, self.dest)
+        assert len(file_changes(action)) == 1
+        self.dest.symlink_to(self.src)
+        assert file_changes(action) == []
@@ -0,0 +1,174 @@
+# Copyright Amethyst Reese
+# Licensed under the MIT license
+
+import os
+import platform
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from unittest import skipIf, TestCase
+
+from dotlink import core
+from dotlink.actions import Generation, Plan
+from dotlink.generations import (
+    current_generation,
+    generations,
+    GENERATIONS_DIR,
+    read_manifest,
+    rollback,
+)
+from dotlink.types import InvalidPlan, Method, Source, Target
+
+CONTENT = "hello world\n"
+
+
+@skipIf(platform.system() == "Windows", "symlinks unsupported on windows")
+class GenerationsTest(TestCase):
+    def setUp(self) -> None:
+        self.td = TemporaryDirectory()
+        self.dir = Path(self.td.name).resolve()
+        self.src = self.dir / "src"
+        self.home = self.dir / "home"
+        (self.src / "nvim").mkdir(parents=True)
+        (self.src / "vimrc").write_text(CONTENT)
+        (self.src / "nvim" / "init.lua").write_text(CONTENT)
+        (self.src / "dotlink").write_text(".vimrc = vimrc\n.config/nvim = nvim\n")
+
+    def tearDown(self) -> None:
+        self.td.cleanup()
+
+    def deploy(self) -> Generation:
+        plan = core.dotlink(
+            Source(path=self.src), Target(self.home), Method.symlink, atomic=True
+        )
+        (action,) = list(plan.execute())
+        assert isinstance(action, Generation)
+        return action
+
+    def test_plan(self) -> None:
+        plan = core.dotlink(
+            Source(path=self.src), Target(self.home), Method.symlink, atomic=True
+        )
+        (action,) = plan.actions
+        assert isinstance(action, Generation)
+        assert action.entries() == [Path(".config/nvim"), Path(".vimrc")]
+
+        with self.assertRaisesRegex(InvalidPlan, "not supported for remote"):
+            core.dotlink(
+                Source(path=self.src),
+                Target(Path("home"), host="host"),
+                Method.copy,
+                atomic=True,
+            )
+
+    def test_deploy(self) -> None:
+        vimrc = self.home / ".vimrc"
+        init = self.home / ".config" / "nvim" / "init.lua"
+
+        with self.subTest("first"):
+            action = self.deploy()
+            assert action.number == 1
+            assert action.size == len(CONTENT) * 2
+            assert current_generation(self.home) == 1
+            assert os.readlink(vimrc) == ".dotlink/current/.vimrc"
+            assert vimrc.read_text() == CONTENT
+            assert init.read_text() == CONTENT
+            assert read_manifest(self.home, 1) == action.entries()
+            assert action.check() is None
+
+        with self.subTest("reuse unchanged"):
+            (self.src / "vimrc").write_text("changed\n")
+            action = self.deploy()
+            assert action.number == 2
+            assert action.size == len("changed\n")
+            assert vimrc.read_text() == "changed\n"
+            gen1, gen2 = (self.home / GENERATIONS_DIR / n for n in ("1", "2"))
+            old, new = (g / ".config" / "nvim" / "init.lua" for g in (gen1, gen2))
+            assert old.stat().st_ino == new.stat().st_ino
+            assert (gen1 / ".vimrc").read_text() == CONTENT
+
+        with self.subTest("drift"):
+            (self.src / "vimrc").write_text("changed again\n")
+            assert action.check() == ".vimrc: size"
+            vimrc.unlink()
+            assert action.check() == ".vimrc: missing"
+
+        with self.subTest("rollback"):
+            assert rollback(self.home) == 1
+            assert current_generation(self.home) == 1
+            assert vimrc.read_text() == CONTENT
+            with self.assertRaisesRegex(InvalidPlan, "no previous generation"):
+                rollback(self.home)
+
+        with self.subTest("collect"):
+            for _ in range(4):
+                self.deploy()
+            assert generations(self.home) == [4, 5, 6]
+            assert current_generation(self.home) == 6
+            assert not (self.home / GENERATIONS_DIR / "1.json").exists()
+
+    def test_stale_entries(self) -> None:
+        self.deploy()
+        (self.src / "dotlink").write_text(".vimrc = vimrc\n")
+        self.deploy()
+        assert (self.home / ".vimrc").is_symlink()
+        assert not (self.home / ".config" / "nvim").exists()
+
+        rollback(self.home)
+        assert (self.home / ".config" / "nvim" / "init.lua").read_text() == CONTENT
+
+    def test_interrupted(self) -> None:
+        self.deploy()
+        (self.home / GENERATIONS_DIR / "new" / "junk").mkdir(parents=True)
+        (self.src / "vimrc").write_text("changed\n")
+
+        plan = core.dotlink(
+            Source(path=self.src), Target(self.home), Method.copy, atomic=True
+        )
+        (action,) = plan.actions
+        action.prepare()
+        (self.src / "vimrc").unlink()
+        with self.assertRaises(FileNotFoundError):
+            action.execute()
+        # failed deploys leave the current generation untouched
+        assert current_generation(self.home) == 1
+        assert (self.home / ".vimrc").read_text() == CONTENT
+
+        (self.src / "vimrc").write_text("changed\n")
+        action = self.deploy()
+        assert action.number == 2
+        assert not (self.home / GENERATIONS_DIR / "2" / "junk").exists()
+
+    def test_directory_destination(self) -> None:
+        (self.home / ".vimrc").mkdir(parents=True)
+        plan = Plan(
+            core.resolve_actions(
+                core.generate_config(self.src),
+                Target(self.home),
+                Method.copy,
+                atomic=True,
+            )
+        )
+        with self.assertRaisesRegex(RuntimeError, "is a directory"):
+            plan.prepare()
+
+    def test_copy_tree(self) -> None:
+        nvim = self.src / "nvim"
+        (nvim / "lua").mkdir()
+        (nvim / "lua" / "plugins.lua").write_text(CONTENT)
+        (nvim / "after").symlink_to("lua")
+        (nvim / "spell").mkdir()
+
+        def tree(root: Path) -> list[str]:
+            return sorted(p.relative_to(root).as_posix() for p in root.rglob("*"))
+
+        plain = self.dir / "plain"
+        list(core.dotlink(Source(path=self.src), Target(plain), Method.copy).execute())
+        list(
+            core.dotlink(
+                Source(path=self.src), Target(self.home), Method.copy, atomic=True
+            ).execute()
+        )
+        staged = self.home / GENERATIONS_DIR / "1" / ".config" / "nvim"
+        assert "spell" in tree(staged)
+        assert "after/plugins.lua" in tree(staged)
+        assert tree(staged) == tree(plain / ".config" / "nvim")
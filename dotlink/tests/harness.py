@@ -0,0 +1,210 @@
+# Copyright Amethyst Reese
+# Licensed under the MIT license
+
+"""
+Fake remote hosts and generated profiles, for end to end tests at scale.
+"""
+
+from __future__ import annotations
+
+import os
+import random
+import sys
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from types import TracebackType
+from typing import Sequence
+from unittest.mock import patch
+
+from dotlink.types import Target
+
+# multiplier for the size of generated profiles, for heavier local runs
+SCALE = int(os.environ.get("DOTLINK_TEST_SCALE", "1"))
+
+FAKE_SSH = """\
+#!{python}
+# stand-in for ssh: runs the remote command locally, within a fake remote root,
+# optionally adding latency, limiting bandwidth, or disconnecting mid-stream
+
+import os
+import subprocess
+import sys
+import time
+
+OPTIONS_WITH_VALUES = {{"-o", "-p", "-i", "-l", "-F"}}
+
+args = sys.argv[1:]
+while args and args[0].startswith("-"):
+    args = args[2:] if args[0] in OPTIONS_WITH_VALUES else args[1:]
+if len(args) < 2:
+    sys.exit("fake ssh: expected a host and a command")
+command = " ".join(args[1:])
+
+state = os.environ["FAKE_SSH_STATE"]
+number = 1
+while True:
+    try:
+        path = os.path.join(state, f"conn-{{number}}")
+        fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        break
+    except FileExistsError:
+        number += 1
+with os.fdopen(fd, "w") as f:
+    f.write(command)
+
+time.sleep(float(os.environ.get("FAKE_SSH_LATENCY") or 0))
+
+bandwidth = float(os.environ.get("FAKE_SSH_BANDWIDTH") or 0)
+disconnect = os.environ.get("FAKE_SSH_DISCONNECT")
+targets = os.environ.get("FAKE_SSH_DISCONNECT_ON")
+if targets and str(number) not in targets.split(","):
+    disconnect = None
+limit = int(disconnect) if disconnect else None
+
+root = os.environ["FAKE_SSH_ROOT"]
+env = dict(os.environ, HOME=root)
+proc = subprocess.Popen(["sh", "-c", command], cwd=root, env=env, stdin=subprocess.PIPE)
+assert proc.stdin
+
+sent = 0
+start = time.monotonic()
+try:
+    while True:
+        chunk = os.read(0, 64 * 1024)
+        if not chunk:
+            break
+        if limit is not None and sent + len(chunk) >= limit:
+            proc.stdin.write(chunk[: limit - sent])
+            proc.kill()
+            proc.wait()
+            sys.stderr.write("fake ssh: connection reset\\n")
+            sys.exit(255)
+        proc.stdin.write(chunk)
+        proc.stdin.flush()
+        sent += len(chunk)
+        if bandwidth:
+            delay = sent / bandwidth - (time.monotonic() - start)
+            if delay > 0:
+                time.sleep(delay)
+    proc.stdin.close()
+except BrokenPipeError:
+    pass
+sys.exit(proc.wait())
+"""
+
+
+class FakeRemote:
+    """
+    Put a fake ``ssh`` first on PATH, with remote commands run in a temp directory.
+
+    The remote root also acts as the remote home directory, so relative target
+    paths and remote caches land within it. Faults can be injected with
+    ``latency`` (seconds per connection), ``bandwidth`` (bytes per second sent
+    to the remote), and ``disconnect`` (bytes sent before the connection drops),
+    limited to specific connection numbers with ``disconnect_on``.
+    """
+
+    def __init__(
+        self,
+        latency: float = 0,
+        bandwidth: float = 0,
+        disconnect: int | None = None,
+        disconnect_on: Sequence[int] = (),
+    ) -> None:
+        self.td = TemporaryDirectory(prefix="dotlink-remote-")
+        base = Path(self.td.name).resolve()
+        self.root = base / "root"
+        self.state = base / "state"
+        self.bin = base / "bin"
+        for path in (self.root, self.state, self.bin):
+            path.mkdir()
+
+        ssh = self.bin / "ssh"
+        ssh.write_text(FAKE_SSH.format(python=sys.executable))
+        ssh.chmod(0o755)
+
+        self.env = patch.dict(
+            os.environ,
+            {
+                "PATH": os.pathsep.join((self.bin.as_posix(), os.environ["PATH"])),
+                "FAKE_SSH_ROOT": self.root.as_posix(),
+                "FAKE_SSH_STATE": self.state.as_posix(),
+                "FAKE_SSH_LATENCY": str(latency),
+                "FAKE_SSH_BANDWIDTH": str(bandwidth),
+                "FAKE_SSH_DISCONNECT": str(disconnect or ""),
+                "FAKE_SSH_DISCONNECT_ON": ",".join(map(str, disconnect_on)),
+            },
+        )
+
+    def __enter__(self) -> FakeRemote:
+        self.env.start()
+        return self
+
+    def __exit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc: BaseException | None,
+        tb: TracebackType | None,
+    ) -> None:
+        self.env.stop()
+        self.td.cleanup()
+
+    def target(self, path: str = "home") -> Target:
+        """
+        Target within the remote root, created if needed like a real home would be.
+        """
+        (self.root / path).mkdir(parents=True, exist_ok=True)
+        return Target(Path(path), host="fake")
+
+    def commands(self) -> list[str]:
+        """
+        Remote commands run so far, in connection order.
+        """
+        names = sorted(
+            (p.name for p in self.state.glob("conn-*")),
+            key=lambda name: int(name.split("-")[1]),
+        )
+        return [(self.state / name).read_text() for name in names]
+
+    def configure(self, **values: str) -> None:
+        """
+        Change fault injection for later connections, eg ``FAKE_SSH_DISCONNECT``.
+        """
+        os.environ.update(values)
+
+
+def generate_profile(
+    root: Path, files: int = 500, size: int = 16 * 1024, seed: int = 0
+) -> list[Path]:
+    """
+    Generate a profile of nested text and binary files, with a mapping file.
+
+    File sizes vary up to ``size`` bytes, and every fifth file is random
+    (incompressible) data. Returns the generated files, relative to root.
+    """
+    rng = random.Random(seed)
+    words = [f"word{i}" for i in range(256)]
+    paths: list[Path] = []
+    for i in range(files * SCALE):
+        path = Path(f"dir{i % 7}", f"sub{i % 13}", f"file{i}")
+        length = rng.randrange(size)
+        if i % 5:
+            text = " ".join(rng.choice(words) for _ in range(length // 6))
+            data = text.encode()[:length]
+        else:
+            data = rng.getrandbits(8 * length).to_bytes(length, "little")
+        (root / path).parent.mkdir(parents=True, exist_ok=True)
+        (root / path).write_bytes(data)
+        paths.append(path)
+
+    mapping = [f".{name} = {name}" for name in sorted({p.parts[0] for p in paths})]
+    (root / "dotlink").write_text("\n".join(mapping) + "\n")
+    return paths
+
+
+def remote_files(root: Path) -> dict[str, bytes]:
+    return {
+        path.relative_to(root).as_posix(): path.read_bytes()
+        for path in root.rglob("*")
+        if path.is_file()
+    }
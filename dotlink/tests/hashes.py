@@ -0,0 +1,107 @@
+# Copyright Amethyst Reese
+# Licensed under the MIT license
+
+import hashlib
+import json
+import os
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+from unittest.mock import patch
+
+from dotlink.actions import Copy
+from dotlink.hashes import HashCache, stat_key
+
+CONTENT = b"hello world\n"
+
+
+class HashCacheTest(TestCase):
+    def setUp(self) -> None:
+        self.td = TemporaryDirectory()
+        self.dir = Path(self.td.name).resolve()
+        self.cache_path = self.dir / "cache" / "hashes.json"
+
+    def tearDown(self) -> None:
+        self.td.cleanup()
+
+    def test_hash(self) -> None:
+        path = self.dir / "file"
+        path.write_bytes(CONTENT)
+        digest = hashlib.sha256(CONTENT).hexdigest()
+        cache = HashCache(self.cache_path)
+
+        with self.subTest("miss"):
+            with patch("dotlink.hashes.file_hash", wraps=lambda p: digest) as fh_mock:
+                assert cache.hash(path) == digest
+                fh_mock.assert_called_once_with(path)
+            assert cache.entries == {stat_key(path.stat()): digest}
+
+        with self.subTest("hit"):
+            with patch("dotlink.hashes.file_hash") as fh_mock:
+                assert cache.hash(path) == digest
+                fh_mock.assert_not_called()
+
+        with self.subTest("persisted"):
+            cache.save()
+            assert not cache.dirty
+            cache = HashCache(self.cache_path)
+            with patch("dotlink.hashes.file_hash") as fh_mock:
+                assert cache.hash(path) == digest
+                fh_mock.assert_not_called()
+
+        with self.subTest("changed"):
+            path.write_bytes(CONTENT.upper())
+            os.utime(path, ns=(1, 1))
+            assert cache.hash(path) == hashlib.sha256(CONTENT.upper()).hexdigest()
+
+    def test_hash_many(self) -> None:
+        paths = []
+        for i in range(20):
+            path = self.dir / f"file{i}"
+            path.write_bytes(CONTENT * i)
+            paths.append(path)
+        cache = HashCache(self.cache_path)
+        digests = cache.hash_many(paths, jobs=4)
+        assert digests == [hashlib.sha256(CONTENT * i).hexdigest() for i in range(20)]
+        assert len(cache.entries) == 20
+
+    def test_eviction(self) -> None:
+        paths = []
+        for i in range(4):
+            path = self.dir / f"file{i}"
+            path.write_bytes(CONTENT * i)
+            paths.append(path)
+
+        cache = HashCache(self.cache_path, limit=2)
+        cache.hash_many(paths[:3])
+        cache.hash(paths[0])  # recently used entries are kept
+        cache.save()
+
+        entries = json.loads(self.cache_path.read_text())
+        assert list(entries) == [stat_key(paths[2].stat()), stat_key(paths[0].stat())]
+
+    def test_unreadable_cache(self) -> None:
+        self.cache_path.parent.mkdir()
+        self.cache_path.write_text("not json")
+        cache = HashCache(self.cache_path)
+        assert cache.entries == {}
+
+    def test_check_uses_cache(self) -> None:
+        src = self.dir / "src"
+        dest = self.dir / "dest"
+        (src / "sub").mkdir(parents=True)
+        (src / "a").write_bytes(CONTENT)
+        (src / "sub" / "b").write_bytes(CONTENT)
+        Copy(src, dest).execute()
+
+        cache = HashCache(self.cache_path)
+        with patch("dotlink.actions.hash_cache", return_value=cache):
+            assert Copy(src, dest).check(content=True) is None
+            assert len(cache.entries) == 2
+
+            with patch("dotlink.hashes.file_hash") as fh_mock:
+                assert Copy(src, dest).check(content=True) is None
+                fh_mock.assert_not_called()
+
+            (dest / "sub" / "b").write_bytes(CONTENT.upper())
+            assert Copy(src, dest).check(content=True) == f"{Path('sub', 'b')}: content"
@@ -0,0 +1,123 @@
+# Copyright Amethyst Reese
+# Licensed under the MIT license
+
+import os
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+from unittest.mock import patch
+
+from dotlink import patterns
+
+
+class PatternsTest(TestCase):
+    def test_is_pattern(self) -> None:
+        for value, expected in (
+            (".vimrc", False),
+            ("config/htop/htoprc", False),
+            ("bin/*", True),
+            ("**/*.vim", True),
+            ("file?", True),
+            ("[ab]", True),
+            ("{a,b}", True),
+        ):
+            with self.subTest(value):
+                assert patterns.is_pattern(value) == expected
+
+    def test_literal_prefix(self) -> None:
+        for value, expected in (
+            ("*", Path()),
+            ("bin/*", Path("bin")),
+            ("config/{a,b}/rc", Path("config")),
+            ("a/b/**/c", Path("a/b")),
+        ):
+            with self.subTest(value):
+                assert patterns.literal_prefix(value) == expected
+
+    def test_compile_pattern(self) -> None:
+        for pattern, matches, misses in (
+            ("*", ["a", ".vimrc"], ["a/b"]),
+            ("bin/*", ["bin/a", "bin/.b"], ["bin", "bin/a/b", "sbin/a"]),
+            ("**", ["a", "a/b/c"], []),
+            ("**/*.vim", ["a.vim", "a/b.vim", "a/b/c.vim"], ["a.vimrc", "a/vim"]),
+            ("a/**/b", ["a/b", "a/x/b", "a/x/y/b"], ["b", "a/xb"]),
+            ("file?.txt", ["file1.txt"], ["file10.txt", "file/.txt"]),
+            ("[ab].c", ["a.c", "b.c"], ["c.c"]),
+            ("[!ab].c", ["c.c"], ["a.c"]),
+            ("{vim,nvim}rc", ["vimrc", "nvimrc"], ["rc", "emacsrc"]),
+            ("{a,b/{c,d}}", ["a", "b/c", "b/d"], ["b", "b/e"]),
+            ("a.b", ["a.b"], ["axb"]),
+        ):
+            with self.subTest(pattern):
+                regex = patterns.compile_pattern(pattern)
+                for value in matches:
+                    assert regex.match(value), f"{pattern} should match {value}"
+                for value in misses:
+                    assert not regex.match(value), f"{pattern} matched {value}"
+
+        with self.assertRaisesRegex(ValueError, "unbalanced braces"):
+            patterns.compile_pattern("{a,b")
+
+    def test_expand(self) -> None:
+        entries = [
+            ("bin", True),
+            ("bin/a", False),
+            ("bin/lib", True),
+            ("bin/lib/b", False),
+            ("vimrc", False),
+        ]
+        assert patterns.expand("bin/*", None, entries) == {
+            Path("bin/a"): Path("bin/a"),
+            Path("bin/lib"): Path("bin/lib"),
+        }
+        assert patterns.expand("bin/*", Path(".local/bin"), entries) == {
+            Path(".local/bin/a"): Path("bin/a"),
+            Path(".local/bin/lib"): Path("bin/lib"),
+        }
+        # matched directories include their contents, so those aren't repeated
+        assert patterns.expand("**", None, entries) == {
+            Path("bin"): Path("bin"),
+            Path("vimrc"): Path("vimrc"),
+        }
+
+    def test_walk_cache(self) -> None:
+        with TemporaryDirectory() as td:
+            tdp = Path(td).resolve()
+            root = tdp / "root"
+            (root / "a" / "b").mkdir(parents=True)
+            (root / ".git").mkdir()
+            (root / ".git" / "HEAD").write_text("\n")
+            (root / "dotlink").write_text("\n")
+            (root / "a" / "file").write_text("\n")
+            (root / "a" / "b" / "file").write_text("\n")
+
+            expected = [
+                ("a", True),
+                ("a/b", True),
+                ("a/b/file", False),
+                ("a/file", False),
+            ]
+            cache = patterns.WalkCache(tdp / "walk.json")
+            assert sorted(cache.walk(root, ignore=["dotlink"])) == expected
+            assert cache.dirty
+            cache.save()
+            assert not cache.dirty
+
+            with self.subTest("unchanged"):
+                cache = patterns.WalkCache(tdp / "walk.json")
+                with patch("dotlink.patterns.os.scandir") as scandir_mock:
+                    assert sorted(cache.walk(root, ignore=["dotlink"])) == expected
+                    scandir_mock.assert_not_called()
+                assert not cache.dirty
+
+            with self.subTest("changed"):
+                (root / "a" / "new").write_text("\n")
+                # ensure the directory mtime changes, even on coarse filesystems
+                st = (root / "a").stat()
+                os.utime(root / "a", ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+                with patch(
+                    "dotlink.patterns.os.scandir", wraps=os.scandir
+                ) as scandir_mock:
+                    assert ("a/new", False) in cache.walk(root)
+                    scandir_mock.assert_called_once_with(root / "a")
+                assert cache.dirty
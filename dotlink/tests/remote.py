@@ -0,0 +1,148 @@
+# Copyright Amethyst Reese
+# Licensed under the MIT license
+
+from __future__ import annotations
+
+import gzip
+import hashlib
+import subprocess
+import sys
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from unittest import skipUnless, TestCase
+from unittest.mock import patch
+
+from dotlink import core
+from dotlink.actions import Action, Plan, SSHChunked, SSHTarball
+from dotlink.types import Method, Source
+
+from .harness import FakeRemote, generate_profile, remote_files
+
+
+@skipUnless(sys.platform == "linux", "fake remote needs a posix shell and tar")
+class RemoteTest(TestCase):
+    def setUp(self) -> None:
+        self.td = TemporaryDirectory()
+        self.src = Path(self.td.name).resolve()
+        self.paths = generate_profile(self.src)
+
+    def tearDown(self) -> None:
+        self.td.cleanup()
+
+    def expected(self) -> dict[str, bytes]:
+        return {
+            Path(f".{path.parts[0]}", *path.parts[1:])
+            .as_posix(): (self.src / path)
+            .read_bytes()
+            for path in self.paths
+        }
+
+    def plans(self, remote: FakeRemote, resumable: bool = False) -> list[Plan]:
+        return core.dotlink_targets(
+            Source(path=self.src), [remote.target()], Method.copy, resumable
+        )
+
+    def deploy(self, remote: FakeRemote, resumable: bool = False) -> list[Action]:
+        return list(core.execute_plans(self.plans(remote, resumable)))
+
+    def test_deploy(self) -> None:
+        with FakeRemote() as remote:
+            actions = self.deploy(remote)
+            assert remote_files(remote.root / "home") == self.expected()
+
+            deploy = actions[-1]
+            assert isinstance(deploy, SSHTarball)
+            assert deploy.size and deploy.elapsed
+            assert remote.commands() == ["tar -xz -f- -C home"]
+
+    def test_check(self) -> None:
+        with FakeRemote() as remote:
+            plans = self.plans(remote)
+            assert len(list(plans[0].check())) == 1
+
+            self.deploy(remote)
+            plans = self.plans(remote)
+            assert list(plans[0].check()) == []
+            assert list(plans[0].check(content=True)) == []
+
+            # one connection per check, regardless of the profile size
+            connections = len(remote.commands())
+            list(plans[0].check())
+            assert len(remote.commands()) == connections + 1
+
+            path = Path(".dir3", *self.paths[3].parts[1:])
+            (remote.root / "home" / path).write_bytes(b"drifted")
+            ((_, drift),) = plans[0].check()
+            assert drift == f"{path}: size"
+
+    def test_bandwidth(self) -> None:
+        bandwidth = 4 * 1024 * 1024
+        with FakeRemote(bandwidth=bandwidth) as remote:
+            deploy = self.deploy(remote)[-1]
+            assert deploy.size and deploy.elapsed
+            assert remote_files(remote.root / "home") == self.expected()
+            assert deploy.elapsed >= deploy.size / bandwidth * 0.9
+
+    @patch("dotlink.actions.SSH_TIMEOUT", 0.5)
+    def test_latency_timeout(self) -> None:
+        with FakeRemote(latency=5) as remote:
+            with self.assertRaises(subprocess.TimeoutExpired):
+                self.deploy(remote)
+
+    def test_disconnect(self) -> None:
+        with FakeRemote(disconnect=64 * 1024) as remote:
+            with self.assertRaises(subprocess.CalledProcessError) as cm:
+                self.deploy(remote)
+            assert cm.exception.returncode == 255
+
+    @patch("dotlink.actions.UPLOAD_CHUNK_SIZE", 64 * 1024)
+    def test_resumable_recovery(self) -> None:
+        # connection 1 lists existing chunks, and the first two uploads drop
+        with FakeRemote(disconnect=1024, disconnect_on=(2, 3)) as remote:
+            actions = self.deploy(remote, resumable=True)
+            assert remote_files(remote.root / "home") == self.expected()
+
+            deploy = actions[-1]
+            assert isinstance(deploy, SSHChunked) and deploy.size
+            chunks = -(-deploy.size // (64 * 1024))
+            commands = remote.commands()
+            uploads = [c for c in commands if c.startswith("cat >")]
+            assert len([c for c in commands if c.startswith("mkdir")]) == 2
+            assert len(uploads) == chunks + 2  # only the dropped chunks are resent
+            assert len([c for c in commands if c.startswith("sh -c 'gzip -dc")]) == 1
+
+            # partial uploads from dropped connections are cleaned up too
+            staging = remote.root / ".cache" / "dotlink" / "upload"
+            assert list(staging.iterdir()) == []
+
+    @patch("dotlink.actions.UPLOAD_CHUNK_SIZE", 64 * 1024)
+    def test_resumable_corrupt_chunk(self) -> None:
+        with FakeRemote() as remote:
+            (plan,) = self.plans(remote, resumable=True)
+            *staging_actions, deploy = plan.actions
+            assert isinstance(deploy, SSHChunked)
+            for action in staging_actions:
+                action.prepare()
+                action.execute()
+
+            # the remote already has a chunk under the right name, but damaged
+            data = deploy.tarball()
+            digest = hashlib.sha256(data[: 64 * 1024]).hexdigest()
+            staging = remote.root / ".cache" / "dotlink" / "upload"
+            staging.mkdir(parents=True)
+            (staging / digest).write_bytes(gzip.compress(b"corrupt", mtime=0))
+
+            deploy.prepare()
+            with self.assertLogs("dotlink", "WARNING") as logs:
+                deploy.execute()
+            key = hashlib.sha256(data).hexdigest()
+            (stderr,) = [r for r in logs.records if r.name == "dotlink.util"]
+            assert (
+                stderr.getMessage()
+                == f"dotlink: reassembled tarball does not match {key}"
+            )
+            assert remote_files(remote.root / "home") == self.expected()
+
+            extracts = [c for c in remote.commands() if c.startswith("sh -c")]
+            assert len(extracts) == 2
+            assert list(staging.iterdir()) == []
@@ -0,0 +1,154 @@
+# Copyright Amethyst Reese
+# Licensed under the MIT license
+
+from __future__ import annotations
+
+import os
+import subprocess
+import sys
+from functools import lru_cache
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+
+import dotlink
+
+ROOT = Path(dotlink.__file__).parent.parent
+
+# import time of dotlink.cli, excluding click, relative to the import time of click
+# in the same interpreter, so that the budget holds on slower machines
+STARTUP_BUDGET = 4.0
+STARTUP_RUNS = 3
+
+# every import made by a local copy deploy, excluding click, relative to click
+LOCAL_BUDGET = 6.0
+
+# modules that should only be imported on the paths that use them
+CLI_FORBIDDEN = (
+    "asyncio",
+    "dotlink.actions",
+    "dotlink.core",
+    "platformdirs",
+    "pprint",
+    "subprocess",
+    "tarfile",
+    "tempfile",
+    "zipfile",
+)
+LOCAL_FORBIDDEN = (
+    "asyncio",
+    "concurrent.futures",
+    "gzip",
+    "mmap",
+    "platformdirs",
+    "pprint",
+    "subprocess",
+    "tarfile",
+    "tempfile",
+    "zipfile",
+)
+
+
+def python(*args: str) -> subprocess.CompletedProcess[str]:
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(
+        p for p in (ROOT.as_posix(), env.get("PYTHONPATH")) if p
+    )
+    return subprocess.run(
+        [sys.executable, *args],
+        env=env,
+        check=True,
+        capture_output=True,
+        encoding="utf-8",
+    )
+
+
+def import_times(code: str) -> tuple[dict[str, int], int]:
+    """
+    Cumulative import time of each module imported by a fresh interpreter running
+    the code, and the total time of the imports made by the code itself.
+    """
+    proc = python("-X", "importtime", "-c", code)
+    times: dict[str, int] = {}
+    total = 0
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        if not cumulative.strip().isdigit():
+            continue
+        times[name.strip()] = int(cumulative)
+        # nested imports are indented, and already counted by their parents
+        if not name.startswith("  ") and name.strip() not in interpreter_imports():
+            total += int(cumulative)
+    return times, total
+
+
+@lru_cache(maxsize=None)
+def interpreter_imports() -> frozenset[str]:
+    """
+    Modules imported by the interpreter itself, before running any code.
+    """
+    proc = python("-X", "importtime", "-c", "pass")
+    return frozenset(
+        line.split("|")[2].strip()
+        for line in proc.stderr.splitlines()
+        if line.startswith("import time:") and line.count("|") == 2
+    )
+
+
+def local_deploy(tdp: Path) -> str:
+    """
+    Code that copies a small profile within the directory, using the cli.
+    """
+    (tdp / "src").mkdir()
+    (tdp / "src" / "vimrc").write_text("hello\n")
+    (tdp / "src" / ".dotlink").write_text(".vimrc = vimrc\n")
+    args = [(tdp / "src").as_posix(), (tdp / "home").as_posix(), "--copy"]
+    return (
+        "from dotlink.cli import main\n"
+        "try:\n"
+        f"    main({args!r})\n"
+        "except SystemExit as e:\n"
+        "    assert not e.code, e.code\n"
+    )
+
+
+def imported_modules(code: str) -> set[str]:
+    proc = python("-c", f"{code}\nimport sys\nprint('\\n'.join(sys.modules))")
+    return set(proc.stdout.splitlines())
+
+
+class StartupTest(TestCase):
+    def test_startup_budget(self) -> None:
+        best = min(
+            (times["dotlink.cli"] - times["click"]) / times["click"]
+            for times, _ in (
+                import_times("import dotlink.cli") for _ in range(STARTUP_RUNS)
+            )
+        )
+        assert best < STARTUP_BUDGET, f"dotlink.cli import took {best:.1f}x click"
+
+    def test_local_budget(self) -> None:
+        ratios = []
+        for _ in range(STARTUP_RUNS):
+            with TemporaryDirectory() as td:
+                times, total = import_times(local_deploy(Path(td).resolve()))
+                ratios.append((total - times["click"]) / times["click"])
+        best = min(ratios)
+        assert best < LOCAL_BUDGET, f"local deploy imports took {best:.1f}x click"
+
+    def test_cli_imports(self) -> None:
+        modules = imported_modules("import dotlink.cli")
+        for name in CLI_FORBIDDEN:
+            with self.subTest(name):
+                assert name not in modules, f"{name} imported at startup"
+
+    def test_local_imports(self) -> None:
+        with TemporaryDirectory() as td:
+            tdp = Path(td).resolve()
+            modules = imported_modules(local_deploy(tdp))
+            assert (tdp / "home" / ".vimrc").read_text() == "hello\n"
+            for name in LOCAL_FORBIDDEN:
+                with self.subTest(name):
+                    assert name not in modules, f"{name} imported by local copy"
@@ -0,0 +1,151 @@
+# Copyright Amethyst Reese
+# Licensed under the MIT license
+
+import os
+import platform
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+from unittest.mock import patch
+
+from dotlink import core, templates
+from dotlink.actions import Template
+from dotlink.types import InvalidPlan, Method, Target
+
+TEMPLATE = "[user]\n  name = {{ user }}\n  host = {{host}}\n  raw = { user } {{\n"
+
+
+class TemplatesTest(TestCase):
+    def setUp(self) -> None:
+        td = TemporaryDirectory()
+        self.addCleanup(td.cleanup)
+        self.dir = Path(td.name).resolve()
+
+        patcher = patch("dotlink.templates.render_cache_dir")
+        self.cache_dir_mock = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.cache_dir_mock.return_value = self.dir / "renders"
+
+    def test_is_template(self) -> None:
+        assert templates.is_template(Path("gitconfig.tmpl"))
+        assert not templates.is_template(Path("gitconfig"))
+        assert not templates.is_template(Path("tmpl/gitconfig"))
+
+    def test_template_variables(self) -> None:
+        variables = templates.template_variables(Target.parse("amy@remote:"))
+        assert variables["host"] == "remote"
+        assert variables["user"] == "amy"
+
+        with patch.dict("os.environ", {"EDITOR": "vim"}):
+            variables = templates.template_variables(Target.parse("local"))
+        assert variables["host"]
+        assert variables["user"]
+        assert variables["env.EDITOR"] == "vim"
+
+    def test_render(self) -> None:
+        result = templates.render(TEMPLATE, {"user": "amy", "host": "a"})
+        assert result == "[user]\n  name = amy\n  host = a\n  raw = { user } {{\n"
+
+        with self.assertRaisesRegex(InvalidPlan, "unknown template variable 'host'"):
+            templates.render(TEMPLATE, {"user": "amy"})
+
+    def test_render_cached(self) -> None:
+        data = TEMPLATE.encode()
+        expected = templates.render(TEMPLATE, {"user": "amy", "host": "a"})
+
+        with patch("dotlink.templates.render", wraps=templates.render) as render_mock:
+            first = templates.render_cached(data, {"user": "amy", "host": "a"})
+            assert first.parent == self.dir / "renders"
+            assert first.read_text() == expected
+            render_mock.assert_called_once()
+
+        with self.subTest("reused"):
+            with patch("dotlink.templates.render") as render_mock:
+                again = templates.render_cached(
+                    data, {"user": "amy", "host": "a", "unused": "x"}
+                )
+                assert again == first
+                render_mock.assert_not_called()
+
+        with self.subTest("changed"):
+            other = templates.render_cached(data, {"user": "amy", "host": "b"})
+            assert other != first
+            assert "host = b" in other.read_text()
+            other = templates.render_cached(data + b"\n", {"user": "amy", "host": "a"})
+            assert other != first
+
+        if platform.system() != "Windows":
+            with self.subTest("private"):
+                assert first.stat().st_mode & 0o777 == 0o600
+                assert first.parent.stat().st_mode & 0o777 == 0o700
+
+        with self.subTest("evicted"):
+            os.utime(other, (0, 0))
+            templates.render_cached(data, {"user": "amy", "host": "c"})
+            assert first.exists()
+            assert not other.exists()
+
+        with self.subTest("render_bytes"):
+            assert templates.render_bytes(data, {"user": "amy", "host": "a"}) == (
+                expected.encode()
+            )
+            rendered = templates.render_bytes(data, {"user": "amy", "host": "d"})
+            assert b"host = d" in rendered
+            assert not templates.render_path(
+                data, {"user": "amy", "host": "d"}
+            ).exists()
+
+    def test_template_action(self) -> None:
+        src = self.dir / "gitconfig.tmpl"
+        src.write_text(TEMPLATE)
+        dest = self.dir / "out" / ".gitconfig"
+        action = Template(src, dest, {"user": "amy", "host": "a"})
+        assert str(action) == f"Template: {src} -> {dest}"
+        assert action.check() == "missing"
+        assert not (self.dir / "renders").exists(), "check shouldn't cache renders"
+
+        action.prepare()
+        action.execute()
+        assert dest.read_text() == templates.render(
+            TEMPLATE, {"user": "amy", "host": "a"}
+        )
+        assert action.check() is None
+
+        assert Template(src, dest, {"user": "amy", "host": "b"}).check() == "content"
+
+        with self.subTest("errors"):
+            with self.assertRaisesRegex(InvalidPlan, "unknown template variable"):
+                Template(src, dest, {}).prepare()
+            binary = self.dir / "binary.tmpl"
+            binary.write_bytes(b"\xff{{ user }}\n")
+            with self.assertRaisesRegex(InvalidPlan, "binary.tmpl: .+ not valid utf-8"):
+                Template(binary, dest, {}).prepare()
+            with self.assertRaisesRegex(InvalidPlan, "binary.tmpl: .+ not valid utf-8"):
+                Template(binary, dest, {}).check()
+            with self.assertRaisesRegex(FileNotFoundError, "does not exist"):
+                Template(self.dir / "missing.tmpl", dest, {}).prepare()
+
+    def test_resolve_templates(self) -> None:
+        (self.dir / ".dotlink").write_text(".gitconfig = gitconfig.tmpl\n.vimrc\n")
+        (self.dir / "gitconfig.tmpl").write_text(TEMPLATE)
+        (self.dir / ".vimrc").write_text("\n")
+        config = core.generate_config(self.dir)
+
+        for target, method in (
+            (Target(self.dir / "out"), Method.symlink),
+            (Target(Path("home"), host="remote"), Method.copy),
+        ):
+            with self.subTest(str(target)):
+                actions = core.resolve_actions(config, target, method)
+                template = actions[0]
+                assert isinstance(template, Template)
+                assert template.src == self.dir / "gitconfig.tmpl"
+                assert template.variables["host"] == (target.host or platform.node())
+                assert not isinstance(actions[1], Template)
+
+        with self.subTest("remote symlink"):
+            target = Target(Path("home"), host="remote")
+            with self.assertRaisesRegex(InvalidPlan, "cannot symlink to template"):
+                core.resolve_actions(
+                    config, target, Method.symlink, remote_symlink=True
+                )
@@ -0,0 +1,286 @@
+# Copyright Amethyst Reese
+# Licensed under the MIT license
+
+import asyncio
+import os
+import platform
+import subprocess
+import tarfile
+import zipfile
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from unittest import skipIf, TestCase
+from unittest.mock import Mock, patch
+
+from dotlink import core
+from dotlink.actions import Extract, Plan
+from dotlink.trees import ArchiveTree, GitTree, is_archive, TarTree, ZipTree
+from dotlink.types import Config, InvalidPlan, Method, Source, Target
+
+CONTENT = "hello world\n"
+
+
+def git(repo: Path, *args: str) -> None:
+    subprocess.run(
+        [
+            "git",
+            "-C",
+            repo.as_posix(),
+            "-c",
+            "user.name=dotlink",
+            "-c",
+            "user.email=dotlink@example.com",
+            *args,
+        ],
+        check=True,
+        capture_output=True,
+    )
+
+
+class GitTreeTest(TestCase):
+    def setUp(self) -> None:
+        td = TemporaryDirectory()
+        self.addCleanup(td.cleanup)
+        self.dir = Path(td.name).resolve()
+        self.repo = self.dir / "repo"
+        self.repo.mkdir()
+
+        (self.repo / ".dotlink").write_text(".vimrc\n.bin = bin\n@inner\n")
+        (self.repo / ".vimrc").write_text(CONTENT)
+        (self.repo / "bin").mkdir()
+        (self.repo / "bin" / "tool").write_text("#!/bin/sh\n")
+        (self.repo / "bin" / "tool").chmod(0o755)
+        (self.repo / "inner").mkdir()
+        (self.repo / "inner" / "dotlink").write_text(".zshrc\n")
+        (self.repo / "inner" / ".zshrc").write_text(CONTENT)
+
+        git(self.repo, "init", "--quiet")
+        git(self.repo, "add", "--all")
+        git(self.repo, "commit", "--quiet", "-m", "initial")
+
+        # reading from the object store must not need the working tree
+        self.bare = self.dir / "bare.git"
+        git(self.dir, "clone", "--quiet", "--bare", "repo", "bare.git")
+        self.tree = asyncio.run(GitTree.open(self.bare, "HEAD"))
+        self.addCleanup(self.tree.reader.close)
+
+    def test_tree(self) -> None:
+        tree = self.tree
+        assert tree.root == self.bare
+        assert tree.is_dir(Path())
+        assert tree.is_dir(Path("bin"))
+        assert not tree.is_file(Path("bin"))
+        assert tree.is_file(Path(".vimrc"))
+        assert not tree.exists(Path("missing"))
+        assert tree.read_text(Path(".vimrc")) == CONTENT
+        assert tree.files(Path("bin")) == [Path("tool")]
+        if platform.system() != "Windows":
+            assert tree.mode(Path("bin/tool")) == 0o100755
+
+        subtree = tree.subtree(Path("inner"))
+        assert subtree.root == self.bare / "inner"
+        assert subtree.is_file(Path("dotlink"))
+        assert subtree.read_text(Path(".zshrc")) == CONTENT
+
+        with self.assertRaisesRegex(FileNotFoundError, "missing not found"):
+            tree.read_bytes(Path("missing"))
+
+    @patch("dotlink.core.user_cache_dir")
+    def test_load_config(self, ucd_mock: Mock) -> None:
+        ucd_mock.return_value = (self.dir / "cache").as_posix()
+        source = Source(url=self.repo.as_posix(), stem="repo")
+
+        for _ in range(2):  # fresh and cached
+            config = core.load_config(source, checkout=False)
+            assert isinstance(config.tree, GitTree)
+            self.addCleanup(config.tree.reader.close)
+            assert config.root.parent == self.dir / "cache"
+            assert config.root.name.endswith("-repo.git")
+            assert not (config.root / ".vimrc").exists()
+            assert config.tree.read_text(Path(".vimrc")) == CONTENT
+
+    def test_generate_config(self) -> None:
+        config = core.generate_config(self.tree.root, self.tree, checkout=False)
+        assert config == Config(
+            root=self.bare,
+            paths={Path(".vimrc"): Path(".vimrc"), Path(".bin"): Path("bin")},
+            includes=[
+                Config(
+                    root=self.bare / "inner",
+                    paths={Path(".zshrc"): Path(".zshrc")},
+                )
+            ],
+        )
+        assert config.tree is self.tree
+        assert config.includes[0].tree is not None
+
+    def test_extract(self) -> None:
+        config = core.generate_config(self.tree.root, self.tree, checkout=False)
+        out = self.dir / "out"
+        plan = Plan(actions=core.resolve_actions(config, Target(out), Method.copy))
+        actions = list(plan.execute())
+        assert all(isinstance(action, Extract) for action in actions)
+
+        assert (out / ".vimrc").read_text() == CONTENT
+        assert (out / ".zshrc").read_text() == CONTENT
+        assert (out / ".bin" / "tool").read_text() == "#!/bin/sh\n"
+        if platform.system() != "Windows":
+            assert os.access(out / ".bin" / "tool", os.X_OK)
+
+        for action in actions:
+            assert action.check() is None
+
+        (out / ".bin" / "tool").write_text("#!/bin/bash\n")
+        (out / ".vimrc").write_text("hello earth\n")
+        assert [action.check() for action in actions] == [
+            "tool: size",
+            "content",
+            None,
+        ]
+
+        with self.subTest("symlink method"):
+            with self.assertRaisesRegex(InvalidPlan, "without checkout"):
+                core.resolve_actions(config, Target(out), Method.symlink)
+
+    @skipIf(platform.system() == "Windows", "symlinks unsupported on windows")
+    def test_symlink_blob(self) -> None:
+        (self.repo / "link").symlink_to(".vimrc")
+        git(self.repo, "add", "link")
+        git(self.repo, "commit", "--quiet", "-m", "link")
+        tree = asyncio.run(GitTree.open(self.repo, "HEAD"))
+        self.addCleanup(tree.reader.close)
+
+        dest = self.dir / "link"
+        action = Extract(tree, Path("link"), dest)
+        action.prepare()
+        action.execute()
+        assert dest.is_symlink()
+        assert os.readlink(dest) == ".vimrc"
+        assert action.check() is None
+
+        dest.unlink()
+        dest.symlink_to(".zshrc")
+        assert action.check() == "points to .zshrc"
+        dest.unlink()
+        dest.write_text(CONTENT)
+        assert action.check() == "not a symlink"
+
+
+class ArchiveTreeTest(TestCase):
+    def setUp(self) -> None:
+        td = TemporaryDirectory()
+        self.addCleanup(td.cleanup)
+        self.dir = Path(td.name).resolve()
+        self.profile = self.dir / "profile"
+        (self.profile / "inner").mkdir(parents=True)
+        (self.profile / ".dotlink").write_text(".vimrc\n@inner\n")
+        (self.profile / ".vimrc").write_text(CONTENT)
+        (self.profile / "inner" / "dotlink").write_text(".zshrc\n")
+        (self.profile / "inner" / ".zshrc").write_text(CONTENT * 100)
+
+    def make_tar(self, name: str, mode: str, arcname: str = ".") -> Path:
+        path = self.dir / name
+        with tarfile.open(path, mode) as tf:
+            tf.add(self.profile, arcname=arcname)
+        return path
+
+    def make_zip(self, name: str, compression: int, prefix: str = "") -> Path:
+        path = self.dir / name
+        with zipfile.ZipFile(path, "w", compression=compression) as zf:
+            for file in sorted(self.profile.rglob("*")):
+                if file.is_file():
+                    zf.write(file, prefix + file.relative_to(self.profile).as_posix())
+        return path
+
+    def assert_deploys(self, archive: Path) -> ArchiveTree:
+        assert is_archive(archive)
+        config = core.load_config(Source.parse(archive.as_posix()), checkout=False)
+        assert config == Config(
+            root=archive,
+            paths={Path(".vimrc"): Path(".vimrc")},
+            includes=[
+                Config(root=archive / "inner", paths={Path(".zshrc"): Path(".zshrc")})
+            ],
+        )
+
+        out = self.dir / f"out-{archive.name}"
+        plan = Plan(actions=core.resolve_actions(config, Target(out), Method.copy))
+        list(plan.execute())
+        assert (out / ".vimrc").read_text() == CONTENT
+        assert (out / ".zshrc").read_text() == CONTENT * 100
+        assert not (out / "dotlink").exists()
+
+        assert isinstance(config.tree, ArchiveTree)
+        return config.tree
+
+    def test_tar(self) -> None:
+        for name, mode in (
+            ("profile.tar", "w:"),
+            ("profile.tar.gz", "w:gz"),
+            ("profile.tar.bz2", "w:bz2"),
+            ("profile.tar.xz", "w:xz"),
+        ):
+            with self.subTest(name):
+                tree = self.assert_deploys(self.make_tar(name, mode))
+                assert isinstance(tree, TarTree)
+                assert tree.compressed == (mode != "w:")
+
+        with self.subTest("uncompressed reads use mmap"):
+            tree = self.assert_deploys(self.make_tar("nested.tar", "w:", "profile"))
+            assert isinstance(tree, TarTree)
+            assert tree.prefix == Path("profile")
+            with patch.object(tree.tarfile, "extractfile", side_effect=AssertionError):
+                assert tree.read_text(Path(".vimrc")) == CONTENT
+
+        with self.subTest("compressed reads in a single pass"):
+            tree = TarTree(self.make_tar("single.tar.gz", "w:gz"))
+            paths = list(reversed(tree.files(Path())))
+            tree.prefetch(paths)
+            with patch.object(
+                tree.tarfile, "extractfile", wraps=tree.tarfile.extractfile
+            ) as extract_mock:
+                for path in paths:
+                    assert tree.read_bytes(path) == (self.profile / path).read_bytes()
+            offsets = [call.args[0].offset_data for call in extract_mock.call_args_list]
+            assert len(offsets) == len(paths)
+            assert offsets == sorted(offsets)
+
+        with self.subTest("compressed reads in a single pass for every target"):
+            archive = self.make_tar("targets.tar.gz", "w:gz")
+            config = core.load_config(Source.parse(archive.as_posix()), checkout=False)
+            assert isinstance(shared := config.tree, TarTree)
+            targets = [Target(self.dir / f"target{i}") for i in range(4)]
+            with patch.object(
+                shared.tarfile, "extractfile", wraps=shared.tarfile.extractfile
+            ) as extract_mock:
+                plans = [
+                    Plan(actions=core.resolve_actions(config, target, Method.copy))
+                    for target in targets
+                ]
+                list(core.execute_plans(plans))
+            for target in targets:
+                assert (target.path / ".zshrc").read_text() == CONTENT * 100
+            assert extract_mock.call_count == 2  # .vimrc and inner/.zshrc, once each
+            assert shared.wanted == {} and shared.cache == {}
+
+    def test_zip(self) -> None:
+        for name, compression in (
+            ("stored.zip", zipfile.ZIP_STORED),
+            ("deflated.zip", zipfile.ZIP_DEFLATED),
+        ):
+            with self.subTest(name):
+                tree = self.assert_deploys(self.make_zip(name, compression))
+                assert isinstance(tree, ZipTree)
+
+        with self.subTest("stored reads use mmap"):
+            archive = self.make_zip("nested.zip", zipfile.ZIP_STORED, "profile/")
+            tree = self.assert_deploys(archive)
+            assert isinstance(tree, ZipTree)
+            assert tree.prefix == Path("profile")
+            with patch.object(tree.zipfile, "read", side_effect=AssertionError):
+                assert tree.read_text(Path("inner/.zshrc")) == CONTENT * 100
+
+    def test_not_archive(self) -> None:
+        for name in ("profile", "profile.tar.bak", "zip"):
+            with self.subTest(name):
+                assert not is_archive(Path(name))
@@ -1,8 +1,20 @@
 # Copyright Amethyst Reese
 # Licensed under the MIT license
 
+from __future__ import annotations
+
+import asyncio
+import errno
+import os
 import shutil
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+from tempfile import TemporaryDirectory
 from unittest import TestCase
+from unittest.mock import patch
 
 from dotlink import util
 
@@ -14,6 +26,80 @@ class UtilTest(TestCase):
         result = util.run(python, "-c", 'print("hello world")', capture_output=True)
         assert result.stdout == "hello world\n"
 
+    def test_run_async(self) -> None:
+        python = shutil.which("python")
+        assert python
+
+        with self.subTest("output"):
+            result = asyncio.run(
+                util.run_async(python, "-c", "print(input())", input=b"hello\n")
+            )
+            assert result.stdout.strip() == b"hello"
+
+        with self.subTest("error"):
+            with self.assertRaises(subprocess.CalledProcessError):
+                asyncio.run(util.run_async(python, "-c", "exit(3)"))
+            result = asyncio.run(util.run_async(python, "-c", "exit(3)", check=False))
+            assert result.returncode == 3
+
+        with self.subTest("timeout"):
+            with self.assertRaises(subprocess.TimeoutExpired):
+                asyncio.run(
+                    util.run_async(
+                        python, "-c", "import time; time.sleep(10)", timeout=0.2
+                    )
+                )
+
+        with self.subTest("concurrency"):
+
+            async def many() -> list[subprocess.CompletedProcess[bytes]]:
+                return await asyncio.gather(
+                    *(
+                        util.run_async(python, "-c", f"print({i})")
+                        for i in range(util.CONCURRENCY * 2)
+                    )
+                )
+
+            results = asyncio.run(many())
+            assert [int(r.stdout) for r in results] == list(range(util.CONCURRENCY * 2))
+
+        with self.subTest("shared across threads"):
+            sleep = [python, "-c", "import time; time.sleep(0.2)"]
+
+            async def four() -> None:
+                await asyncio.gather(*(util.run_async(*sleep) for _ in range(4)))
+
+            with patch("dotlink.util._semaphore", threading.BoundedSemaphore(2)):
+                before = time.monotonic()
+                threads = [
+                    threading.Thread(target=asyncio.run, args=(four(),))
+                    for _ in range(2)
+                ]
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+                # eight commands, only two at a time, regardless of event loop
+                assert time.monotonic() - before >= 0.8
+
+        with self.subTest("echo"):
+            with patch("builtins.print") as print_mock:
+                asyncio.run(util.run_async(python, "-c", "pass"))
+                print_mock.assert_not_called()
+                asyncio.run(util.run_async(python, "-c", "pass", echo=True))
+                print_mock.assert_called_once_with(f"$ {python} -c pass")
+
+    def test_shell_path(self) -> None:
+        for value, expected in (
+            ("/target", "/target"),
+            ("my dotfiles", "'my dotfiles'"),
+            ("~", "~"),
+            ("~/my dotfiles", "~/'my dotfiles'"),
+            ("~user/x", "'~user/x'"),
+        ):
+            with self.subTest(value):
+                self.assertEqual(expected, util.shell_path(Path(value)))
+
     def test_sha1(self) -> None:
         for value, expected in (
             ("", "da39"),
@@ -22,3 +108,78 @@ class UtilTest(TestCase):
         ):
             with self.subTest(value):
                 self.assertEqual(expected, util.sha1(value))
+
+    def test_file_hash(self) -> None:
+        with TemporaryDirectory() as td:
+            path = Path(td) / "file"
+            path.write_text("hello")
+            self.assertEqual(
+                "2cf24dba5fb0a30e26e83b2ac5b9e29e1b161e5c1fa7425e73043362938b9824",
+                util.file_hash(path),
+            )
+
+    def test_clone_file(self) -> None:
+        with TemporaryDirectory() as td:
+            src = Path(td) / "src"
+            dest = Path(td) / "dest"
+            src.write_bytes(b"hello" * 1000)
+            util.clone_file(src, dest)
+            assert dest.read_bytes() == src.read_bytes()
+
+    def test_clone_file_large(self) -> None:
+        with TemporaryDirectory() as td, patch("dotlink.util.FICLONE", 0):
+            src = Path(td) / "src"
+            dest = Path(td) / "dest"
+            size = util.LARGE_FILE_SIZE + 4096
+            with src.open("wb") as f:
+                f.write(b"head")
+                f.seek(size - 4)
+                f.write(b"tail")
+
+            with patch("dotlink.util.sparse_copy", wraps=util.sparse_copy) as sc_mock:
+                assert util.clone_file(src, dest) == size
+                sc_mock.assert_called_once()
+            assert dest.read_bytes() == src.read_bytes()
+
+            src_blocks = getattr(src.stat(), "st_blocks", None)
+            if src_blocks is not None and src_blocks * 512 < size:
+                # source is sparse on this filesystem, so holes should be kept
+                assert dest.stat().st_blocks * 512 < size
+
+    def test_sparse_copy(self) -> None:
+        with TemporaryDirectory() as td:
+            src = Path(td) / "src"
+            dest = Path(td) / "dest"
+            data = os.urandom(3 * util.CHUNK_SIZE + 17)
+            src.write_bytes(data)
+
+            with self.subTest("data ranges"):
+                with src.open("rb") as f:
+                    ranges = list(util.data_ranges(f.fileno(), len(data)))
+                assert ranges == [(0, len(data))]
+
+            with self.subTest("copy"):
+                with src.open("rb") as fsrc, dest.open("wb") as fdest:
+                    util.sparse_copy(fsrc.fileno(), fdest.fileno(), len(data))
+                assert dest.read_bytes() == data
+
+            if sys.platform == "linux":
+                with self.subTest("no copy_file_range"):
+                    dest.unlink()
+                    error = OSError(errno.EXDEV, "cross-device link")
+                    with patch("os.copy_file_range", side_effect=error) as cfr_mock:
+                        with src.open("rb") as fsrc, dest.open("wb") as fdest:
+                            util.sparse_copy(fsrc.fileno(), fdest.fileno(), len(data))
+                    cfr_mock.assert_called()
+                    assert dest.read_bytes() == data
+
+    def test_format_size(self) -> None:
+        for size, expected in (
+            (0, "0 B"),
+            (1023, "1023 B"),
+            (1536, "1.5 KiB"),
+            (5 * 1024 * 1024, "5.0 MiB"),
+            (3 * 1024**5, "3072.0 TiB"),
+        ):
+            with self.subTest(size):
+                assert util.format_size(size) == expected
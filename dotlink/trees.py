@@ -0,0 +1,368 @@
+# Copyright Amethyst Reese
+# Licensed under the MIT license
+
+from __future__ import annotations
+
+import atexit
+import copy
+import stat
+import struct
+import threading
+from pathlib import Path
+from typing import AbstractSet, IO, Iterable, Mapping, TYPE_CHECKING
+
+from typing_extensions import Self
+
+from .util import run_async
+
+if TYPE_CHECKING:
+    import subprocess
+    from tarfile import TarInfo
+    from zipfile import ZipInfo
+
+TAR_SUFFIXES = (".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tbz2", ".tar.xz", ".txz")
+ZIP_SUFFIXES = (".zip",)
+ZIP_LOCAL_HEADER = struct.Struct("<4s22xHH")
+
+
+class Tree:
+    """
+    Read-only view of source files that are not checked out on the filesystem.
+
+    Paths are relative to the tree, and :attr:`root` is only used for display
+    and for resolving relative includes.
+    """
+
+    root: Path
+
+    def is_dir(self, path: Path) -> bool:
+        raise NotImplementedError
+
+    def is_file(self, path: Path) -> bool:
+        raise NotImplementedError
+
+    def exists(self, path: Path) -> bool:
+        return self.is_dir(path) or self.is_file(path)
+
+    def mode(self, path: Path) -> int:
+        raise NotImplementedError
+
+    def read_bytes(self, path: Path) -> bytes:
+        raise NotImplementedError
+
+    def prefetch(self, paths: Iterable[Path]) -> None:
+        """
+        Hint that these files will be read soon, so they can be read together.
+        """
+
+    def read_text(self, path: Path) -> str:
+        return self.read_bytes(path).decode("utf-8")
+
+    def files(self, path: Path) -> list[Path]:
+        """
+        List all files within the given directory, relative to that directory.
+        """
+        raise NotImplementedError
+
+    def subtree(self, path: Path) -> Tree:
+        raise NotImplementedError
+
+
+class BatchReader:
+    """
+    Long-lived ``git cat-file --batch`` process for reading objects by id.
+    """
+
+    def __init__(self, repo: Path) -> None:
+        self.repo = repo
+        self.lock = threading.Lock()
+        self.proc: subprocess.Popen[bytes] | None = None
+
+    def _pipes(self) -> tuple[IO[bytes], IO[bytes]]:
+        if self.proc is None:
+            import subprocess
+
+            self.proc = subprocess.Popen(
+                ["git", "-C", self.repo.as_posix(), "cat-file", "--batch"],
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+            )
+            atexit.register(self.close)
+        assert self.proc.stdin and self.proc.stdout
+        return self.proc.stdin, self.proc.stdout
+
+    def read(self, oid: str) -> bytes:
+        with self.lock:
+            stdin, stdout = self._pipes()
+            stdin.write(f"{oid}\n".encode())
+            stdin.flush()
+
+            header = stdout.readline().split()
+            if len(header) != 3:
+                raise FileNotFoundError(f"object {oid} not found in {self.repo}")
+            data = stdout.read(int(header[2]))
+            stdout.read(1)  # trailing newline
+            return data
+
+    def close(self) -> None:
+        with self.lock:
+            if self.proc is not None:
+                assert self.proc.stdin
+                self.proc.stdin.close()
+                self.proc.wait()
+                self.proc = None
+
+
+class GitTree(Tree):
+    """
+    Files from a git commit, read directly from the repository's object store.
+
+    The commit's file listing is read once, and blob contents are only read on
+    demand, through a single shared :class:`BatchReader`.
+    """
+
+    def __init__(
+        self,
+        repo: Path,
+        entries: Mapping[Path, tuple[int, str]],
+        reader: BatchReader | None = None,
+        prefix: Path = Path(),
+        dirs: AbstractSet[Path] | None = None,
+    ) -> None:
+        self.repo = repo
+        self.entries = entries
+        self.reader = reader or BatchReader(repo)
+        self.prefix = prefix
+        self.root = repo / prefix
+        if dirs is None:
+            dirs = {parent for path in entries for parent in path.parents}
+        self.dirs = dirs
+
+    @classmethod
+    async def open(cls, repo: Path, rev: str) -> Self:
+        proc = await run_async(
+            "git",
+            "-C",
+            repo.as_posix(),
+            "ls-tree",
+            "-r",
+            "-z",
+            "--full-tree",
+            rev,
+        )
+        entries: dict[Path, tuple[int, str]] = {}
+        for record in proc.stdout.split(b"\0"):
+            if not record:
+                continue
+            info, _, name = record.partition(b"\t")
+            mode, kind, oid = info.decode().split()
+            if kind == "blob":
+                entries[Path(name.decode("utf-8"))] = (int(mode, 8), oid)
+        return cls(repo, entries)
+
+    def is_dir(self, path: Path) -> bool:
+        return (self.prefix / path) in self.dirs
+
+    def is_file(self, path: Path) -> bool:
+        return (self.prefix / path) in self.entries
+
+    def mode(self, path: Path) -> int:
+        try:
+            return self.entries[self.prefix / path][0]
+        except KeyError:
+            raise FileNotFoundError(f"{self.root / path} not found") from None
+
+    def read_bytes(self, path: Path) -> bytes:
+        try:
+            _, oid = self.entries[self.prefix / path]
+        except KeyError:
+            raise FileNotFoundError(f"{self.root / path} not found") from None
+        return self.reader.read(oid)
+
+    def files(self, path: Path) -> list[Path]:
+        base = self.prefix / path
+        return sorted(
+            entry.relative_to(base) for entry in self.entries if base in entry.parents
+        )
+
+    def subtree(self, path: Path) -> GitTree:
+        return GitTree(
+            self.repo, self.entries, self.reader, self.prefix / path, self.dirs
+        )
+
+
+def is_archive(path: Path) -> bool:
+    return path.name.lower().endswith(TAR_SUFFIXES + ZIP_SUFFIXES)
+
+
+def open_archive(path: Path) -> ArchiveTree:
+    if path.name.lower().endswith(ZIP_SUFFIXES):
+        return ZipTree(path)
+    return TarTree(path)
+
+
+class ArchiveTree(Tree):
+    """
+    Files from a tar or zip archive, extracted selectively on demand.
+
+    Archive members are indexed once when opened. Members stored without
+    compression are read directly from a memory map of the archive, and mapped
+    members of compressed tars are read together in a single pass.
+    If the archive only contains a single top level directory, that directory
+    is treated as the root of the tree.
+    """
+
+    def __init__(self, archive: Path) -> None:
+        self.archive = archive
+        self.lock = threading.Lock()
+        self.modes: dict[Path, int] = {}
+        self.dirs: set[Path] = set()
+        self.index()
+
+        for path in self.modes:
+            self.dirs.update(path.parents)
+
+        self.prefix = Path()
+        children = {path.parts[0] for path in self.modes}
+        if len(children) == 1 and (child := Path(children.pop())) in self.dirs:
+            self.prefix = child
+        self.root = archive
+
+        import mmap
+
+        with archive.open("rb") as f:
+            self.mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def index(self) -> None:
+        raise NotImplementedError
+
+    def add(self, name: str, mode: int) -> Path | None:
+        path = Path(name)
+        if path.is_absolute() or ".." in path.parts or path == Path():
+            return None
+        if stat.S_ISDIR(mode):
+            self.dirs.add(path)
+            return None
+        self.modes[path] = mode
+        return path
+
+    def member(self, path: Path) -> Path:
+        if (member := self.prefix / path) not in self.modes:
+            raise FileNotFoundError(f"{self.root / path} not found")
+        return member
+
+    def is_dir(self, path: Path) -> bool:
+        return (self.prefix / path) in self.dirs
+
+    def is_file(self, path: Path) -> bool:
+        return (self.prefix / path) in self.modes
+
+    def mode(self, path: Path) -> int:
+        return self.modes[self.member(path)]
+
+    def files(self, path: Path) -> list[Path]:
+        base = self.prefix / path
+        return sorted(
+            member.relative_to(base) for member in self.modes if base in member.parents
+        )
+
+    def subtree(self, path: Path) -> ArchiveTree:
+        tree = copy.copy(self)
+        tree.prefix = self.prefix / path
+        tree.root = self.root / path
+        return tree
+
+
+class TarTree(ArchiveTree):
+    def index(self) -> None:
+        import tarfile
+
+        try:
+            self.tarfile = tarfile.open(self.archive, mode="r:")
+            self.compressed = False
+        except tarfile.ReadError:
+            self.tarfile = tarfile.open(self.archive, mode="r:*")
+            self.compressed = True
+
+        self.members: dict[Path, TarInfo] = {}
+        # prefetched reads still pending for each member, across every target
+        self.wanted: dict[Path, int] = {}
+        self.cache: dict[Path, bytes] = {}
+        for info in self.tarfile.getmembers():
+            mode: int
+            if info.isdir():
+                mode = stat.S_IFDIR
+            elif info.issym():
+                mode = stat.S_IFLNK | 0o777
+            elif info.isreg():
+                mode = stat.S_IFREG | info.mode
+            else:
+                continue
+            if path := self.add(info.name, mode):
+                self.members[path] = info
+
+    def read_bytes(self, path: Path) -> bytes:
+        member = self.member(path)
+        info = self.members[member]
+        if info.issym():
+            return info.linkname.encode("utf-8")
+        if not self.compressed:
+            return self.mmap[info.offset_data : info.offset_data + info.size]
+        with self.lock:
+            if member not in self.cache:
+                # seeking backwards restarts decompression from the beginning, so
+                # read every wanted member in a single pass, in archive order
+                for wanted in sorted({member, *self.wanted}, key=self.offset):
+                    if wanted not in self.cache:
+                        fileobj = self.tarfile.extractfile(self.members[wanted])
+                        assert fileobj is not None
+                        self.cache[wanted] = fileobj.read()
+            # keep the data until every prefetched read of it has happened
+            if self.wanted.get(member, 0) > 1:
+                self.wanted[member] -= 1
+                return self.cache[member]
+            self.wanted.pop(member, None)
+            return self.cache.pop(member)
+
+    def offset(self, member: Path) -> int:
+        return self.members[member].offset_data
+
+    def prefetch(self, paths: Iterable[Path]) -> None:
+        if not self.compressed:
+            return
+        with self.lock:
+            for path in paths:
+                info = self.members.get(member := self.prefix / path)
+                if info and not info.issym():
+                    self.wanted[member] = self.wanted.get(member, 0) + 1
+
+
+class ZipTree(ArchiveTree):
+    def index(self) -> None:
+        import zipfile
+
+        self.zipfile = zipfile.ZipFile(self.archive)
+        self.members: dict[Path, ZipInfo] = {}
+        self.stored: set[Path] = set()
+        for info in self.zipfile.infolist():
+            mode = info.external_attr >> 16
+            if info.is_dir():
+                mode = stat.S_IFDIR
+            elif info.create_system != 3 or not stat.S_IFMT(mode):
+                mode = stat.S_IFREG | 0o644  # not created on unix
+            if path := self.add(info.filename, mode):
+                self.members[path] = info
+                if info.compress_type == zipfile.ZIP_STORED and not info.flag_bits & 1:
+                    self.stored.add(path)
+
+    def read_bytes(self, path: Path) -> bytes:
+        member = self.member(path)
+        info = self.members[member]
+        if member in self.stored:
+            start = info.header_offset
+            magic, name_len, extra_len = ZIP_LOCAL_HEADER.unpack_from(self.mmap, start)
+            if magic == b"PK\x03\x04":
+                start += ZIP_LOCAL_HEADER.size + name_len + extra_len
+                return self.mmap[start : start + info.file_size]
+        with self.lock:
+            return self.zipfile.read(info)
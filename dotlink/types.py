@@ -7,11 +7,14 @@ import re
 from dataclasses import dataclass, field
 from enum import auto, Enum
 from pathlib import Path
-from typing import Mapping, Sequence, Tuple
+from typing import Mapping, Sequence, Tuple, TYPE_CHECKING
 from urllib.parse import urlparse
 
 from typing_extensions import Self, TypeAlias
 
+if TYPE_CHECKING:
+    from .trees import Tree
+
 USER_HOST_REGEX = re.compile(
     r"""
     ^
@@ -40,6 +43,7 @@ class Config:
     root: Path
     paths: Mapping[Path, Path] = field(default_factory=dict)
     includes: Sequence[Config] = field(default_factory=list)
+    tree: Tree | None = field(default=None, compare=False, repr=False)
 
 
 @dataclass(frozen=True)
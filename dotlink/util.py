@@ -3,14 +3,35 @@
 
 from __future__ import annotations
 
+import errno
 import hashlib
-
+import logging
+import os
 import shlex
-import subprocess
-from typing import Any
+import shutil
+import sys
+import threading
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import Any, AsyncGenerator, Generator, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import subprocess
+
+LOG = logging.getLogger(__name__)
+CHUNK_SIZE = 1024 * 1024
+CONCURRENCY = 8
+FICLONE = 0x40049409
+LARGE_FILE_SIZE = 16 * 1024 * 1024
+SEMAPHORE_POLL = 0.01
+
+# shared by every thread and event loop, so concurrent plans share one limit
+_semaphore = threading.BoundedSemaphore(CONCURRENCY)
 
 
 def run(*cmd: str, **kwargs: Any) -> subprocess.CompletedProcess[str]:
+    import subprocess
+
     print(f"$ {shlex.join(cmd)}")
 
     kwargs.setdefault("encoding", "utf-8")
@@ -19,6 +40,197 @@ def run(*cmd: str, **kwargs: Any) -> subprocess.CompletedProcess[str]:
     return proc
 
 
+def user_cache_dir(appname: str) -> str:
+    """
+    Per-user cache directory, without importing platformdirs until it's needed.
+    """
+    import platformdirs
+
+    return platformdirs.user_cache_dir(appname)
+
+
+@asynccontextmanager
+async def _concurrency_slot() -> AsyncGenerator[None, None]:
+    import asyncio
+
+    # poll rather than block, so waiting never stalls the event loop
+    while not _semaphore.acquire(blocking=False):
+        await asyncio.sleep(SEMAPHORE_POLL)
+    try:
+        yield
+    finally:
+        _semaphore.release()
+
+
+async def run_async(
+    *cmd: str,
+    input: bytes | None = None,
+    timeout: float | None = None,
+    check: bool = True,
+    echo: bool = False,
+) -> subprocess.CompletedProcess[bytes]:
+    """
+    Run a command in a subprocess, capturing output, with an optional timeout.
+
+    At most :data:`CONCURRENCY` commands run at once across the whole process.
+    The subprocess is killed if the timeout expires or the caller is cancelled.
+    Commands are logged at debug level, or printed if ``echo`` is set.
+    """
+    import asyncio
+    import subprocess
+
+    async with _concurrency_slot():
+        if echo:
+            print(f"$ {shlex.join(cmd)}")
+        else:
+            LOG.debug("$ %s", shlex.join(cmd))
+
+        proc = await asyncio.create_subprocess_exec(
+            *cmd,
+            stdin=(subprocess.DEVNULL if input is None else subprocess.PIPE),
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+        )
+        try:
+            stdout, stderr = await asyncio.wait_for(proc.communicate(input), timeout)
+        except asyncio.TimeoutError:
+            proc.kill()
+            await proc.wait()
+            raise subprocess.TimeoutExpired(list(cmd), timeout or 0) from None
+        except asyncio.CancelledError:
+            proc.kill()
+            await proc.wait()
+            raise
+
+    assert proc.returncode is not None
+    result = subprocess.CompletedProcess(list(cmd), proc.returncode, stdout, stderr)
+    LOG.debug("%s returned %d", cmd[0], result.returncode)
+    if stderr and result.returncode:
+        LOG.warning("%s", stderr.decode("utf-8", errors="replace").rstrip())
+    if check:
+        result.check_returncode()
+    return result
+
+
+def shell_path(path: Path) -> str:
+    """
+    Quote a remote path for the shell, leaving a leading ``~/`` to be expanded.
+    """
+    value = path.as_posix()
+    if value == "~":
+        return value
+    if value.startswith("~/"):
+        return "~/" + shlex.quote(value[2:])
+    return shlex.quote(value)
+
+
 def sha1(value: str) -> str:
     k = hashlib.sha1(value.encode("utf-8"))
     return k.hexdigest()[:4]
+
+
+def file_hash(path: Path) -> str:
+    k = hashlib.sha256()
+    with path.open("rb") as f:
+        while chunk := f.read(CHUNK_SIZE):
+            k.update(chunk)
+    return k.hexdigest()
+
+
+def clone_file(src: Path, dest: Path) -> int:
+    """
+    Copy a file, sharing its contents copy-on-write (reflink) where supported.
+
+    Otherwise, large files are copied with :func:`sparse_copy`. Returns the size
+    of the copied file.
+    """
+    size = src.stat().st_size
+    with src.open("rb") as fsrc, dest.open("wb") as fdest:
+        if sys.platform == "linux":
+            import fcntl
+
+            try:
+                fcntl.ioctl(fdest.fileno(), FICLONE, fsrc.fileno())
+                return size
+            except OSError:
+                pass
+
+        if size >= LARGE_FILE_SIZE:
+            sparse_copy(fsrc.fileno(), fdest.fileno(), size)
+            return size
+
+    shutil.copyfile(src, dest)
+    return size
+
+
+def data_ranges(fd: int, size: int) -> Generator[tuple[int, int], None, None]:
+    """
+    Find ranges of a file that contain data, skipping holes where supported.
+    """
+    if sys.platform == "win32":
+        yield 0, size
+        return
+
+    offset = 0
+    while offset < size:
+        try:
+            start = os.lseek(fd, offset, os.SEEK_DATA)
+        except OSError as e:
+            if e.errno == errno.ENXIO:
+                return  # only holes remain
+            if e.errno in (errno.EINVAL, errno.EOPNOTSUPP):
+                yield offset, size  # filesystem doesn't support seeking holes
+                return
+            raise
+        end = min(os.lseek(fd, start, os.SEEK_HOLE), size)
+        yield start, end
+        offset = end
+
+
+def copy_range(fsrc: int, fdest: int, start: int, end: int) -> None:
+    """
+    Copy a range of bytes between files, in the kernel with copy_file_range where
+    available, or in chunks otherwise.
+    """
+    offset = start
+    if sys.platform == "linux":
+        try:
+            while offset < end:
+                count = os.copy_file_range(fsrc, fdest, end - offset, offset, offset)
+                if not count:
+                    break
+                offset += count
+        except OSError as e:
+            if e.errno not in (errno.ENOSYS, errno.EXDEV, errno.EINVAL, errno.EPERM):
+                raise
+
+    os.lseek(fsrc, offset, os.SEEK_SET)
+    os.lseek(fdest, offset, os.SEEK_SET)
+    while offset < end:
+        data = os.read(fsrc, min(CHUNK_SIZE, end - offset))
+        if not data:
+            break
+        view = memoryview(data)
+        while view:
+            written = os.write(fdest, view)
+            view = view[written:]
+        offset += len(data)
+
+
+def sparse_copy(fsrc: int, fdest: int, size: int) -> None:
+    """
+    Copy between open files, leaving holes in the destination for sparse sources.
+    """
+    for start, end in data_ranges(fsrc, size):
+        copy_range(fsrc, fdest, start, end)
+    os.ftruncate(fdest, size)
+
+
+def format_size(size: float) -> str:
+    for unit in ("B", "KiB", "MiB", "GiB"):
+        if size < 1024:
+            break
+        size /= 1024
+    else:
+        unit = "TiB"
+    return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"